@@ -0,0 +1,141 @@
+"""Micro-benchmark of the CoAP datagram parser
+
+Compares pyShelly.coap_parser.parse on a reused memoryview with the
+inline bytearray parsing CoAP._loop used before.
+
+    python benchmarks/bench_coap_parser.py [iterations]
+"""
+import os
+import socket
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyShelly import coap_parser  # pylint: disable=wrong-import-position
+from pyShelly.compat import s     # pylint: disable=wrong-import-position
+
+def _option(delta, value):
+    """Encode one CoAP option with extended delta and length"""
+    head = bytearray([0])
+    ext = bytearray()
+    if delta >= 269:
+        head[0] = 14 << 4
+        ext += struct.pack('>H', delta - 269)
+    elif delta >= 13:
+        head[0] = 13 << 4
+        ext.append(delta - 13)
+    else:
+        head[0] = delta << 4
+    length = len(value)
+    if length >= 13:
+        head[0] |= 13
+        ext.append(length - 13)
+    else:
+        head[0] |= length
+    return bytes(head + ext + value)
+
+def build_datagram(device_type, device_id, payload, proxy_ip=None):
+    """Build a CoIoT status datagram as sent by a Gen1 device"""
+    data = b'\x50\x1e\x00\x01'
+    data += _option(3332, ("%s#%s#2" % (device_type, device_id)).encode())
+    data += _option(3412 - 3332, struct.pack('>H', 38400))
+    data += _option(3420 - 3412, struct.pack('>H', 1))
+    data += b'\xff' + payload.encode()
+    if proxy_ip:
+        data = b'prxy' + socket.inet_aton(proxy_ip) + data
+    return data
+
+SAMPLES = [
+    build_datagram('SHSW-25', 'A4CF12F3F0D2',
+                   '{"G":[[0,9103,0],[0,1101,1],[0,1102,0],[0,4101,38.52],'
+                   '[0,4103,1023554],[0,6102,0],[0,1103,0],[0,4102,0],'
+                   '[0,4104,13225],[0,6103,0],[0,3104,46.83],[0,3105,116.29],'
+                   '[0,6101,0],[0,9101,"relay"],[0,3106,0],[0,4105,230.1],'
+                   '[0,2101,0],[0,2102,""],[0,2103,0],[0,2201,0],'
+                   '[0,2202,""],[0,2203,0]]}'),
+    build_datagram('SHEM-3', 'C45BBE6B0A1F',
+                   '{"G":[[0,9103,3],[0,1101,1],[0,4105,812.35],'
+                   '[0,4106,1523412.5],[0,4107,2253.1],[0,4108,231.42],'
+                   '[0,4109,3.51],[0,4110,0.97],[0,4205,102.44],'
+                   '[0,4206,842421.1],[0,4207,0],[0,4208,230.2],[0,4209,0.47],'
+                   '[0,4210,0.93],[0,4305,0],[0,4306,22541.8],[0,4307,0],'
+                   '[0,4308,232.1],[0,4309,0],[0,4310,0]]}'),
+    build_datagram('SHHT-1', '6A2BC1', '{"G":[[0,3101,21.5],[0,3103,46.5],'
+                   '[0,3111,87],[0,3115,0],[0,9102,["button"]],[0,9103,4]]}',
+                   proxy_ip='10.0.20.15'),
+]
+
+def legacy_parse(data_tmp, ipaddr):
+    """Inline parser from CoAP._loop, kept as reference"""
+    data = bytearray(data_tmp)
+    if len(data) < 10:
+        return None
+    pos = 0
+    if data[0] == 112 and data[1] == 114 \
+       and data[2] == 120 and data[3] == 121:
+        ipaddr = socket.inet_ntoa(data[4:8])
+        pos = 8
+    byte = data[pos]
+    tkl = byte & 0x0F
+    code = data[pos+1]
+    pos = pos + 4 + tkl
+    if code == 30 or code == 69:
+        byte = data[pos]
+        tot_delta = 0
+        device_type = ''
+        device_id = ''
+        while byte != 0xFF:
+            delta = byte >> 4
+            length = byte & 0x0F
+            if delta == 13:
+                pos = pos + 1
+                delta = data[pos] + 13
+            elif delta == 14:
+                pos = pos + 2
+                delta = data[pos - 1] * 256 + data[pos] + 269
+            tot_delta = tot_delta + delta
+            if length == 13:
+                pos = pos + 1
+                length = data[pos] + 13
+            elif length == 14:
+                pos = pos + 2
+                length = data[pos - 1] * 256 + data[pos] + 269
+            value = data[pos + 1:pos + length]
+            pos = pos + length + 1
+            if tot_delta == 3332:
+                device_type, device_id, _ = s(value).split('#', 2)
+            byte = data[pos]
+        payload = s(data[pos + 1:])
+        return code, device_type, device_id, ipaddr, payload
+    return None
+
+def run_legacy():
+    for sample in SAMPLES:
+        legacy_parse(sample, '192.168.1.10')
+
+BUF = bytearray(4096)
+VIEW = memoryview(BUF)
+
+def run_parser():
+    for sample in SAMPLES:
+        size = len(sample)
+        BUF[:size] = sample     # Stands in for recvfrom_into
+        coap_parser.parse(VIEW[:size], '192.168.1.10')
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for sample in SAMPLES:
+        old = legacy_parse(sample, '192.168.1.10')
+        new = coap_parser.parse(memoryview(sample), '192.168.1.10')
+        assert old[:4] == tuple(new[:4]), (old, new)
+    count = iterations * len(SAMPLES)
+    for name, func in (('legacy inline loop', run_legacy),
+                       ('coap_parser.parse', run_parser)):
+        sec = min(timeit.repeat(func, number=iterations, repeat=3))
+        print("%-20s %8.2f us/datagram  %10.0f datagrams/s"
+              % (name, sec / count * 1e6, count / sec))
+
+if __name__ == '__main__':
+    main()
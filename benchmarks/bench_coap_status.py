@@ -0,0 +1,52 @@
+"""Micro-benchmark of the CoIoT status ("G" array) decoder
+
+Compares pyShelly.coap_parser.decode_status with the decode path used
+before, the DW2 repair of every payload. Both get the str payload that
+CoAP._process passes on.
+
+    python benchmarks/bench_coap_status.py [iterations]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyShelly import coap_parser  # pylint: disable=wrong-import-position
+from pyShelly.compat import s     # pylint: disable=wrong-import-position
+from bench_coap_parser import SAMPLES  # pylint: disable=wrong-import-position
+
+PAYLOADS = [s(coap_parser.parse(memoryview(sample), '').payload)
+            for sample in SAMPLES]
+#Broken payload as sent by some DW2 firmwares
+PAYLOADS.append('{"G":[[0,9103,1],[0,3108,0],,[0,3109,-1][0,6110,0],'
+                '[0,3101,21.3],[0,3106,12],[0,3111,100]]}')
+
+def legacy_decode(payload):
+    """Decode path from CoAP._loop and pyShelly.update_block"""
+    if payload:
+        payload = payload.replace(",,", ",").replace("][", "],[")
+    return {d[1]:d[2] for d in json.loads(payload)['G']}
+
+def run_legacy():
+    for payload in PAYLOADS:
+        legacy_decode(payload)
+
+def run_decoder():
+    for payload in PAYLOADS:
+        coap_parser.decode_status(payload)
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for payload in PAYLOADS:
+        assert legacy_decode(payload) == coap_parser.decode_status(payload)
+    count = iterations * len(PAYLOADS)
+    for name, func in (('legacy json path', run_legacy),
+                       ('decode_status', run_decoder)):
+        sec = min(timeit.repeat(func, number=iterations, repeat=5))
+        print("%-20s %8.2f us/payload  %10.0f payloads/s"
+              % (name, sec / count * 1e6, count / sec))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Throughput of the CoAP listener with one or more dispatch workers
+
+Sender processes blast unicast CoIoT datagrams for a few hundred
+simulated devices at 127.0.0.1:5683 and the number of datagrams handled
+by pyShelly.update_block per second is reported for each worker count.
+There is one receive socket, the workers are threads sharing the GIL, so
+this shows the cost of the hand-off rather than a scaling on more cores.
+Needs a free port 5683.
+
+    python benchmarks/bench_coap_workers.py [seconds] [workers ...]
+"""
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pyShelly import pyShelly       # pylint: disable=wrong-import-position
+from bench_coap_parser import build_datagram  # pylint: disable=wrong-import-position
+
+DEVICES = 400
+SENDERS = 4
+
+def sender(stop, offset):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    cnt = 0
+    while not stop.is_set():
+        for idx in range(offset, DEVICES, SENDERS):
+            cnt += 1
+            payload = '{"G":[[0,1101,%d],[0,4101,%d.5],[0,4103,%d],' \
+                      '[0,3104,45.2],[0,2101,0]]}' % (cnt & 1, cnt % 100, cnt)
+            data = build_datagram('SHSW-PM', 'B%011X' % idx, payload)
+            try:
+                sock.sendto(data, ('127.0.0.1', 5683))
+            except socket.error:
+                pass
+
+class CountingShelly(pyShelly):
+    def __init__(self):
+        super(CountingShelly, self).__init__()
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def update_block(self, *args, **kwargs):
+        super(CountingShelly, self).update_block(*args, **kwargs)
+        with self._lock:
+            self.count += 1
+
+def run(workers, seconds):
+    root = CountingShelly()
+    root.coap_workers = workers
+    root.host_ip = '127.0.0.1'
+    root._coap.start()
+    root.stopped.wait(11)    # Listener waits 10 s before receiving
+    stop = multiprocessing.Event()
+    procs = [multiprocessing.Process(target=sender, args=(stop, idx))
+             for idx in range(SENDERS)]
+    for proc in procs:
+        proc.start()
+    time.sleep(1)
+    start_cnt, start = root.count, time.time()
+    time.sleep(seconds)
+    rate = (root.count - start_cnt) / (time.time() - start)
+    stop.set()
+    for proc in procs:
+        proc.join()
+    root.close()
+    time.sleep(0.5)
+    return rate
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    counts = [int(arg) for arg in sys.argv[2:]] or [1, 2, 4]
+    print("cpus: %d" % multiprocessing.cpu_count())
+    for workers in counts:
+        print("%d worker(s): %10.0f datagrams/s" % (workers, run(workers, seconds)))
+
+if __name__ == '__main__':
+    main()
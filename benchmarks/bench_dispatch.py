@@ -0,0 +1,143 @@
+"""Benchmark of applying decoded messages to blocks and devices
+
+Measures the cost per message after decoding, for CoAP, HTTP status,
+Gen1 MQTT, Gen2 RPC and Gen2 polled status. The unchanged payload check is disabled so each
+message is applied in full.
+
+    python benchmarks/bench_dispatch.py [iterations]
+"""
+import json
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# pylint: disable=wrong-import-position
+import pyShelly.firmware
+pyShelly.firmware.Firmware_manager.start_loop = lambda self: None
+from pyShelly import pyShelly as PyShelly
+from pyShelly import coap_parser
+from pyShelly.block import Block
+from pyShelly.compat import s
+from pyShelly.const import SRC_STATUS
+from bench_coap_parser import SAMPLES, build_datagram
+
+Block.payload_unchanged = lambda self, key, payload: False
+
+#Shelly 1 with addon devices waiting for values in the lazy state
+COAP_SAMPLES = SAMPLES + [
+    build_datagram('SHSW-1', 'E8DB84D2A1B0',
+                   '{"G":[[0,9103,1],[0,1101,1],[0,2101,0],[0,2102,""],'
+                   '[0,2103,0],[0,3117,-1],[0,9101,"relay"]]}')]
+
+EM3_STATUS = {
+    "wifi_sta": {"connected": True, "ssid": "net", "ip": "192.168.1.11",
+                 "rssi": -58},
+    "cloud": {"enabled": True, "connected": True},
+    "mqtt": {"connected": False},
+    "relays": [{"ison": True, "has_timer": False, "overpower": False}],
+    "emeters": [{"power": 812.35, "pf": 0.97, "current": 3.51,
+                 "voltage": 231.42, "is_valid": True, "total": 1523412.5,
+                 "total_returned": 2253.1},
+                {"power": 102.44, "pf": 0.93, "current": 0.47,
+                 "voltage": 230.2, "is_valid": True, "total": 842421.1,
+                 "total_returned": 0},
+                {"power": 0, "pf": 0, "current": 0, "voltage": 232.1,
+                 "is_valid": True, "total": 22541.8, "total_returned": 0}],
+    "update": {"status": "idle", "has_update": False,
+               "new_version": "20220209-093605/v1.11.8-g8c7bb8d",
+               "old_version": "20220209-093605/v1.11.8-g8c7bb8d"},
+    "uptime": 123456
+}
+
+PRO4PM_STATUS = {
+    "switch:%d" % idx: {"id": idx, "output": idx % 2 == 0,
+                        "apower": 12.5 * idx, "voltage": 230.1,
+                        "current": 0.1 * idx,
+                        "aenergy": {"total": 100.5 * idx},
+                        "temperature": {"tC": 45.2}}
+    for idx in range(4)}
+PRO4PM_STATUS.update({"input:%d" % idx: {"id": idx, "state": False}
+                      for idx in range(4)})
+PRO4PM_STATUS.update({"wifi": {"sta_ip": "192.168.1.77", "ssid": "net",
+                               "rssi": -60},
+                      "sys": {"uptime": 100},
+                      "cloud": {"connected": True},
+                      "mqtt": {"connected": True}})
+
+MQTT_EM3 = [('shellies/shellyem3-C45BBE6B0A1F/emeter/%d/%s' % (idx, name),
+             value)
+            for idx in range(3)
+            for name, value in (('power', '123.5'), ('pf', '0.97'),
+                                ('current', '0.54'), ('voltage', '229.5'),
+                                ('total', '1523412.5'))]
+MQTT_EM3.append(('shellies/shellyem3-C45BBE6B0A1F/relay/0', 'on'))
+
+#Values alternate so every delta changes the status
+NOTIFY = [json.dumps({"src": "shellypro4pm-aabbcc", "method": "NotifyStatus",
+                      "params": {"ts": 1, "switch:1": {"id": 1,
+                                                       "apower": power}}})
+          for power in (10.5, 11.5)]
+
+def setup():
+    logging.disable(logging.CRITICAL)
+    root = PyShelly()
+    root.websocket_enabled = False
+    for sample in COAP_SAMPLES:
+        root._coap._process(memoryview(sample), '192.168.1.10')
+    get_status = {"id": 1, "src": "shellypro4pm-aabbcc", "dst": "x",
+                  "result": PRO4PM_STATUS}
+    root._mqtt_server.receive_msg('shellypro4pm-aabbcc/events/rpc',
+                                  json.dumps(get_status))
+    return root
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    root = setup()
+    coap = []
+    for sample in COAP_SAMPLES:
+        msg = coap_parser.parse(memoryview(sample), '192.168.1.10')
+        block = root.blocks[msg.device_id.upper()]
+        coap.append((block, coap_parser.decode_status(s(msg.payload))))
+    em3 = root.blocks['C45BBE6B0A1F']
+    mqtt = root._mqtt_server
+
+    def run_coap():
+        for block, data in coap:
+            block.update_coap(data, '192.168.1.10')
+
+    def run_status():
+        em3._update_status_info(EM3_STATUS, SRC_STATUS)
+
+    def run_mqtt():
+        for topic, data in MQTT_EM3:
+            mqtt.receive_msg(topic, data)
+
+    #Full status polls with one value changed
+    pro = root.blocks['AABBCC']
+    polls = [json.loads(json.dumps(PRO4PM_STATUS)) for _ in range(2)]
+    polls[1]['switch:1']['apower'] += 1
+
+    def run_poll():
+        for status in polls:
+            pro.update_rpc(status, SRC_STATUS, True)
+
+    def run_rpc():
+        for notify in NOTIFY:
+            mqtt.receive_msg('shellypro4pm-aabbcc/events/rpc', notify)
+
+    for name, func, count in (('CoAP', run_coap, len(coap)),
+                              ('HTTP status', run_status, 1),
+                              ('Gen1 MQTT', run_mqtt, len(MQTT_EM3)),
+                              ('Gen2 NotifyStatus', run_rpc, len(NOTIFY)),
+                              ('Gen2 GetStatus', run_poll, len(polls))):
+        sec = min(timeit.repeat(func, number=iterations, repeat=5))
+        print("%-20s %8.2f us/message  %10.0f messages/s"
+              % (name, sec / iterations / count * 1e6,
+                 iterations * count / sec))
+    root.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark of memory per block
+
+Builds N simulated blocks of each type, from CoAP for Gen1 and from a
+Shelly.GetStatus response over MQTT for Gen2, and reports the growth of
+RSS and of memory allocated by Python per block. RSS is measured first,
+without tracemalloc, then the blocks are built again with it.
+
+    python benchmarks/bench_memory.py [blocks per type]
+"""
+import gc
+import json
+import logging
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# pylint: disable=wrong-import-position
+import pyShelly.firmware
+pyShelly.firmware.Firmware_manager.start_loop = lambda self: None
+from pyShelly import pyShelly as PyShelly
+from pyShelly import coap_parser
+from bench_coap_parser import build_datagram
+from bench_dispatch import COAP_SAMPLES, PRO4PM_STATUS
+
+def rss():
+    """Resident set size in bytes, Linux only"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        return 0
+
+def gen1_builder(root, sample):
+    msg = coap_parser.parse(memoryview(sample), '192.168.1.10')
+    device_type = msg.device_type
+    payload = bytes(msg.payload).decode()
+
+    def build(idx):
+        datagram = build_datagram(device_type, '%06X%06X' % (idx, idx),
+                                  payload)
+        root._coap._process(memoryview(datagram),
+                            '10.%d.%d.1' % (idx // 250, idx % 250))
+    return device_type, build
+
+def gen2_builder(root):
+    def build(idx):
+        name = 'shellypro4pm-%06x' % idx
+        msg = {"id": 1, "src": name, "dst": "x", "result": PRO4PM_STATUS}
+        root._mqtt_server.receive_msg(name + '/events/rpc', json.dumps(msg))
+    return 'Pro 4PM', build
+
+def measure(count, memory):
+    """Return [(type, devices per block, bytes per block)]"""
+    root = PyShelly()
+    root.websocket_enabled = False
+    builders = [gen1_builder(root, sample) for sample in COAP_SAMPLES]
+    builders.append(gen2_builder(root))
+    result = []
+    for offset, (name, build) in enumerate(builders):
+        gc.collect()
+        blocks = len(root.blocks)
+        devices = sum(len(block.devices) for block in root.blocks.values())
+        start = memory()
+        for idx in range(count):
+            build(offset * count + idx)
+        gc.collect()
+        added = len(root.blocks) - blocks
+        added_devices = sum(len(block.devices)
+                            for block in root.blocks.values()) - devices
+        result.append((name, added_devices / float(added),
+                       (memory() - start) / float(added)))
+    root.close()
+    return result
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    logging.disable(logging.CRITICAL)
+    rss_result = measure(count, rss)
+    tracemalloc.start()
+    alloc_result = measure(count, lambda: tracemalloc.get_traced_memory()[0])
+    print("%-10s %8s %12s %14s" % ('type', 'devices', 'RSS B/block',
+                                   'alloc B/block'))
+    for (name, devices, rss_size), (_, _, alloc) in zip(rss_result,
+                                                        alloc_result):
+        print("%-10s %8.1f %12.0f %14.0f" % (name, devices, rss_size, alloc))
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,7 @@ from .block import Block
 from .device import Device
 from .utils import exception_log, timer
 from .coap import CoAP
+from .coap_parser import decode_status
 from .mqtt_server import MQTT_server
 from .mqtt_client import MQTT_client
 #from .debug import Debug_server
@@ -26,12 +27,19 @@ try:
 except:
     pass
 from .firmware import Firmware_manager
+from .cit import Cit_cache
+from .coiot_peer import Coiot_peer_manager
+from .coalesce import Update_coalescer
+from .deadband import Deadband_filter
+from .executor import PriorityExecutor, PRIORITY_POLL
+from .scheduler import Poll_scheduler
+from .capture import Recorder
 
 #from .device.relay import Relay
 #from .device.switch import Switch
 #from .device.powermeter import Po
 
-from .utils import shelly_http_get
+from .utils import shelly_http_get, HTTP_POOL
 from .compat import s, b, ba2c
 from .const import (
     LOGGER,
@@ -62,6 +70,7 @@ from .const import (
     INFO_VALUE_BATTERY,
     ATTR_PATH,
     ATTR_FMT,
+    SRC_COAP,
     BLOCK_INFO_VALUES,
     SHELLY_TYPES,
     EFFECTS_RGBW2,
@@ -70,6 +79,17 @@ from .const import (
 
 __version__ = VERSION
 
+#Seconds to wait after the first failed probe of a device added by IP,
+#doubled for every failure
+PROBE_BACKOFF = 60
+PROBE_MAX_BACKOFF = 600
+
+def probe_delay(errors):
+    """Seconds to the next probe after errors failed probes in a row"""
+    if errors < 1:
+        return 0
+    return min(PROBE_BACKOFF * 2 ** (errors - 1), PROBE_MAX_BACKOFF)
+
 class pyShelly():
     def __init__(self, loop=None):
         LOGGER.info("Init  %s", VERSION)
@@ -81,12 +101,51 @@ class pyShelly():
         self.cb_device_removed = []
         self.cb_save_cache = None
         self.cb_load_cache = None
-        # Used if igmp packages not sent correctly
+        # Used if igmp packages not sent correctly, rejoin multicast on
+        # interfaces that have gone silent
         self.igmp_fix_enabled = False
+        # Local ips to join CoAP multicast on, default host_ip
+        self.multicast_interfaces = []
+        # Number of threads updating blocks from CoAP, more than one moves
+        # update_block and its callbacks off the receive thread
+        self.coap_workers = 1
+        # Configure Gen1 devices to send CoIoT unicast to host_ip
+        self.coiot_unicast_enabled = False
+        # Max number of devices configured at the same time
+        self.coiot_unicast_workers = 4
+        # Number of threads polling status and sending HTTP commands, one
+        # at a time per block
+        self.poll_workers = 8
+        # Number of threads probing devices added by IP or mDNS
+        self.probe_workers = 4
+        # Coalesce update callbacks of a device within this many seconds,
+        # None calls them at once
+        self.update_coalesce_window = None
+        # Window per changed attribute, 'state' or info value name, 0 is
+        # sent at once
+        self.update_coalesce_policy = {}
+        # Min change of a numeric info value or 'state' to send an update,
+        # a number or '<n>%' of the last value sent
+        self.info_value_deadbands = {}
+        # Send a value held back by its deadband after this many seconds
+        self.info_value_max_silence = 300
+        # Max update events queued by each events() stream, added and
+        # removed events are always kept
+        self.event_queue_size = 1000
+        # When the event queue is full, 'latest' keeps the latest update
+        # per block or device, 'drop_oldest' or 'drop_newest'
+        self.event_queue_overflow = 'latest'
+        self._event_streams = []
         self.mdns_enabled = False
         self.username = None
         self.password = None
         self.update_status_interval = None
+        # Poll interval per block type, overrides update_status_interval,
+        # None does not poll the type
+        self.update_status_intervals = {}
+        # A block that pushes is still polled this often
+        self.update_status_max_interval = timedelta(minutes=10)
+        self._poll_scheduler = Poll_scheduler(self)
         self._update_thread = None
         self._socket = None
         self.only_device_id = None
@@ -102,6 +161,12 @@ class pyShelly():
         self._mqtt_client = MQTT_client(self)
         #self._debug_server = None
         self._firmware_mgr =  Firmware_manager(self)
+        self._cit_cache = Cit_cache(self)
+        self._coiot_peer = Coiot_peer_manager(self)
+        self._coalescer = None
+        self._deadband = None
+        self._poll_executor = None
+        self._probe_executor = None
         self.host_ip = ''
         self.bind_ip = '0.0.0.0'
         self.mqtt_port = 0
@@ -113,6 +178,9 @@ class pyShelly():
         self.mqtt_server_password = ''
 
         self._shelly_by_ip = {}
+        self.payload_unchanged_cnt = 0
+        self.websocket_enabled = True
+        self.recorder = None
         #self.loop = asyncio.get_event_loop()
         self.event_loop = None
         try:
@@ -123,7 +191,6 @@ class pyShelly():
         except:
             pass
 
-        self._send_discovery_timer = timer(60)
         self._check_by_ip_timer = timer(10)        
 
     def send_mqtt(self, block, topic, payload, rpc, params=None):
@@ -173,6 +240,13 @@ class pyShelly():
         self.cloud_auth_key = key
 
     def start(self):
+        if self.update_coalesce_window is not None:
+            self._coalescer = Update_coalescer(self)
+        if self.info_value_deadbands:
+            self._deadband = Deadband_filter(self.info_value_deadbands,
+                                             self.info_value_max_silence)
+        self._poll_executor = PriorityExecutor(self.poll_workers, "Poll")
+        self._probe_executor = PriorityExecutor(self.probe_workers, "Probe")
         if self.mdns_enabled:
             self._mdns = MDns(self, self.zeroconf)
         self.set_cloud_settings(self.cloud_server, self.cloud_auth_key, True)
@@ -184,6 +258,7 @@ class pyShelly():
             self._mqtt_server.start()
         if self._mqtt_client:
             self._mqtt_client.start()
+        self._coiot_peer.start(self.coiot_unicast_enabled)
         #self._debug_server = Debug_server(self)
         #asyncio.ensure_future(self._update_loop())
         self._update_thread = threading.Thread(target=self._update_loop)
@@ -194,8 +269,40 @@ class pyShelly():
     def version(self):
         return VERSION
 
+    def restore_coiot_multicast(self):
+        """Stop CoIoT unicast, clear the peer of all Gen1 devices and
+        reboot them"""
+        self.coiot_unicast_enabled = False
+        self._coiot_peer.restore_multicast()
+
+    def events(self):
+        """Async iterator of Event for added, removed and updated blocks
+        and devices, handled in event_loop"""
+        #Imported here, async syntax
+        from .events import Event_stream
+        stream = Event_stream(self, self.event_loop or asyncio.get_event_loop(),
+                              self.event_queue_size, self.event_queue_overflow)
+        for block in list(self.blocks.values()):
+            stream.block_added(block)
+        for dev in list(self.devices):
+            stream.device_added(dev, not dev.lazy_load)
+        self._event_streams.append(stream)
+        return stream
+
+    def start_recording(self, path):
+        """Record all received CoAP, MQTT and WebSocket traffic to file"""
+        self.stop_recording()
+        self.recorder = Recorder(path)
+
+    def stop_recording(self):
+        recorder = self.recorder
+        self.recorder = None
+        if recorder:
+            recorder.close()
+
     def close(self):
         self.stopped.set()
+        self.stop_recording()
         if self._coap:
             self._coap.close()
         if self._mdns:
@@ -206,8 +313,17 @@ class pyShelly():
             self._mqtt_client.close()
         if self._update_thread is not None:
             self._update_thread.join()
+        if self._poll_executor:
+            self._poll_executor.close()
+        if self._probe_executor:
+            self._probe_executor.close()
+        if self._coalescer:
+            self._coalescer.close()
+        for stream in list(self._event_streams):
+            stream.close()
         if self._socket:
             self._socket.close()
+        HTTP_POOL.close()
 
     def discover(self):
         if self._coap:
@@ -230,80 +346,89 @@ class pyShelly():
 
 
     def check_by_ip(self):
+        """Probe the devices added by IP or mDNS on the probe workers"""
+        now = time.time()
+        block_by_ip = {}
+        for block in list(self.blocks.values()):
+            if block.ip_addr:
+                block_by_ip[block.ip_addr] = block
         for uid in list(self._shelly_by_ip.keys()):
             data = self._shelly_by_ip[uid]
-            delay = data.get('delay')
-            if delay:
-                data['delay'] = delay - 1
+            if data.get('probing') or data.get('next_try', 0) > now:
                 continue
             if data["src"] == "mDns" and "ip-addr" in data:
                 ip_addr = self._mdns.get_ip(*data['id'].split('|'))
                 if data["ip-addr"] != ip_addr:
                     data["done"] = False
             if not data['done']:
-                done = False                
                 if data['src'] == 'mDns':
                     ip_addr = self._mdns.get_ip(*data['id'].split('|'))
                 else:
                     ip_addr = data['id']
                 data["ip-addr"] = ip_addr
-                for id in self.blocks.keys():
-                    block = self.blocks[id]                    
-                    if block.ip_addr == ip_addr:
-                        self._shelly_by_ip[uid]['done'] = True
-                        done = True                
-                if done:
+                if ip_addr in block_by_ip:
+                    data['done'] = True
                     continue
-                success, shelly = shelly_http_get(
-                    ip_addr, "/shelly", self.username, self.password, False)                
-                if success:
-                    gen = shelly.get('gen', 1)                    
-                    if gen==1:
-                        success, settings = shelly_http_get(
-                            ip_addr, "/settings", self.username, self.password, False)
+                data['probing'] = True
+                if self._probe_executor:
+                    self._probe_executor.submit(uid, PRIORITY_POLL,
+                                                self._probe, data, ip_addr)
+                else:
+                    self._probe(data, ip_addr)
+
+    def _probe(self, data, ip_addr):
+        """Add the block at ip_addr, retry later with backoff if it fails"""
+        done = False
+        try:
+            success, shelly = shelly_http_get(
+                ip_addr, "/shelly", self.username, self.password, False)                
+            if success:
+                gen = shelly.get('gen', 1)                    
+                if gen==1:
+                    success, settings = shelly_http_get(
+                        ip_addr, "/settings", self.username, self.password, False)
+                    if success:
+                        success, status = shelly_http_get(
+                            ip_addr, "/status", self.username, self.password, False)
                         if success:
-                            success, status = shelly_http_get(
-                                ip_addr, "/status", self.username, self.password, False)
-                            if success:
-                                done = True
-                                self._shelly_by_ip[uid]['done'] = True
-                                dev = settings["device"]
-                                device_id = dev["hostname"].rpartition('-')[2]
-                                device_type = dev["type"]
-                                ip_addr = status["wifi_sta"]["ip"]
-                                LOGGER.debug("Add device from IP, %s, %s, %s", device_id, device_type, ip_addr)
-                                self.update_block(device_id, device_type, ip_addr,
-                                                data['src'],
-                                                None)
-                                if device_id in self.blocks:
-                                    block = self.blocks[device_id]
-                                    if block and block.sleep_device:
-                                        self._shelly_by_ip[uid]['poll_block'] \
-                                            = block
-                                self._shelly_by_ip[uid]['errors'] = 0
-                    elif gen==2:
-                        done = True
-                        self._shelly_by_ip[uid]['done'] = True
-                        device_id = shelly["mac"]
-                        device_type = "Shelly" + shelly["app"]
-                        LOGGER.debug("Add device from IP, %s, %s, %s", device_id, device_type, ip_addr)
-                        self.update_block(device_id, device_type, ip_addr,
-                                        data['src'],
-                                        None)
-                        if device_id in self.blocks:
-                            block = self.blocks[device_id]
-                            if block and block.sleep_device:
-                                self._shelly_by_ip[uid]['poll_block'] \
-                                    = block
-                        self._shelly_by_ip[uid]['errors'] = 0
-                if not done:
-                    errors = data.get('errors', 0)
-                    self._shelly_by_ip[uid]['errors'] = errors + 1
-                    self._shelly_by_ip[uid]['delay'] = 60
-                    if errors > 5:
-                        self._shelly_by_ip[uid]['delay'] = 600
-                    LOGGER.info("Error adding device, %s %s",
-                                ip_addr, data['src'])
+                            done = True
+                            data['done'] = True
+                            dev = settings["device"]
+                            device_id = dev["hostname"].rpartition('-')[2]
+                            device_type = dev["type"]
+                            ip_addr = status["wifi_sta"]["ip"]
+                            LOGGER.debug("Add device from IP, %s, %s, %s", device_id, device_type, ip_addr)
+                            self.update_block(device_id, device_type, ip_addr,
+                                            data['src'],
+                                            None)
+                            if device_id in self.blocks:
+                                block = self.blocks[device_id]
+                                if block and block.sleep_device:
+                                    data['poll_block'] \
+                                        = block
+                            data['errors'] = 0
+                elif gen==2:
+                    done = True
+                    data['done'] = True
+                    device_id = shelly["mac"]
+                    device_type = "Shelly" + shelly["app"]
+                    LOGGER.debug("Add device from IP, %s, %s, %s", device_id, device_type, ip_addr)
+                    self.update_block(device_id, device_type, ip_addr,
+                                    data['src'],
+                                    None)
+                    if device_id in self.blocks:
+                        block = self.blocks[device_id]
+                        if block and block.sleep_device:
+                            data['poll_block'] \
+                                = block
+                    data['errors'] = 0
+        finally:
+            if not done:
+                errors = data['errors'] = data.get('errors', 0) + 1
+                data['next_try'] = time.time() + probe_delay(errors)
+                LOGGER.info("Error adding device, %s %s",
+                            ip_addr, data['src'])
+            data['probing'] = False
 
     def add_device(self, dev, discovery_src):
         LOGGER.debug('Add device')
@@ -311,8 +436,13 @@ class pyShelly():
         self.devices.append(dev)
         if not dev.lazy_load:
             self.callback_add_device(dev)
+        else:
+            for stream in self._event_streams:
+                stream.device_added(dev, False)
 
     def callback_add_device(self, dev):
+        for stream in self._event_streams:
+            stream.device_added(dev)
         if hasattr(dev, 'discovery_src'):
             for callback in self.cb_device_added:
                 dev.lazy_load = False
@@ -321,6 +451,8 @@ class pyShelly():
     def remove_device(self, dev, discovery_src):
         LOGGER.debug('Remove device')
         self.devices.remove(dev)
+        for stream in self._event_streams:
+            stream.device_removed(dev)
         for callback in self.cb_device_removed:
             callback(dev, discovery_src)
 
@@ -339,6 +471,7 @@ class pyShelly():
             block = self.blocks[block_id] = \
                 Block(self, block_id, device_type, ipaddr, src)
             block_added = True
+            self._poll_scheduler.add(block, datetime.now())
 
         block = self.blocks[block_id]
 
@@ -349,15 +482,24 @@ class pyShelly():
             block.ip_addr = ipaddr
             block.force_all_update()
 
+        if src == "CoAP-msg":
+            block.last_coap = block.last_push = datetime.now()
+
         if payload:
             if src == "MQTT":
                 block.update_mqtt(payload)
+            elif src == "CoAP-discovery":
+                block.update_cit(payload)
+            elif block.payload_unchanged(SRC_COAP, payload):
+                pass
             else:
-                data = {d[1]:d[2] for d in json.loads(payload)['G']}
+                data = decode_status(payload)
                 block.payload = payload
                 block.update_coap(data, ipaddr)
 
         if block_added:
+            for stream in self._event_streams:
+                stream.block_added(block)
             for callback in self.cb_block_added:
                 callback(block)
 
@@ -371,15 +513,13 @@ class pyShelly():
                 #LOGGER.debug("Checking blocks")
                 if self._check_by_ip_timer.check():
                     self.check_by_ip()
-                if self._send_discovery_timer.check():
+                if self._coap and self._coap.discovery_due():
                     self.discover()
 
+                self._poll_scheduler.run(datetime.now())
+
                 for key in list(self.blocks.keys()):
                     block = self.blocks[key]
-
-                    if not block.sleep_device:
-                        self._poll_block(block)
-
                     block.check_available()
                     block.loop()
 
@@ -389,15 +529,20 @@ class pyShelly():
 
     def _poll_block(self, block, force=False):
         now = datetime.now()
+        interval = self._poll_scheduler.interval(block)
         if force or \
-            (self.update_status_interval is not None and \
+            (interval is not None and \
             (block.last_update_status_info is None or \
-            now - block.last_update_status_info \
-                > self.update_status_interval)):
+            now - block.last_update_status_info > interval)):
             LOGGER.debug("Polling block, %s %s", block.id, block.type)
             block.last_update_status_info = now
-            t = threading.Thread(
-                target=block.update_status_information)
-            t.name = "S4H-Poll status"
-            t.daemon = True
-            t.start()
+            if self._poll_executor:
+                self._poll_executor.submit(block.id, PRIORITY_POLL,
+                                           block.update_status_information,
+                                           unique=block.id)
+            else:
+                t = threading.Thread(
+                    target=block.update_status_information)
+                t.name = "S4H-Poll status"
+                t.daemon = True
+                t.start()
@@ -1,16 +1,9 @@
 import traceback
-import json
 from datetime import datetime
 
 from .const import (
     BLOCK_INFO_VALUES,
     LOGGER,
-    ATTR_PATH,
-    ATTR_FMT,
-    ATTR_POS,
-    ATTR_CHANNEL,
-    ATTR_TOPIC,
-    ATTR_RPC,
     REGEX_VER,
     SRC_COAP,
     SRC_STATUS,
@@ -19,225 +12,183 @@ from .const import (
     SRC_WS,
     SRC_WS_STATUS
 )
+from .extractor import compile_cfg, compile_cfgs, expand_coap_pos
+from .values import SOURCE_SLOTS, field_table, put, Source_state, \
+    Source_values
+
 class Base(object):
 
+    #Attributes are slots, __dict__ is only created when an integration
+    #attaches an attribute of its own
+    __slots__ = ('info_values', '_info_value_cfg', '_fields', '_updated',
+                 '_source_values', '_states', '_state_cfg', '_channel',
+                 '_state_ext', '_info_ext', '_sensor_ids', 'cb_updated',
+                 'need_update', 'lazy_load', 'debug', 'state', '_coalescer',
+                 '_update_window', '_deadband', '_sent_values', 'cb_changed',
+                 '_changes', '__dict__', '__weakref__')
+
+    #Stored in _states and _source_values, see values.py
+    state_status = Source_state(SRC_STATUS)
+    state_coap = Source_state(SRC_COAP)
+    state_mqtt = Source_state(SRC_MQTT)
+    state_mqtt_status = Source_state(SRC_MQTT_STATUS)
+    state_ws = Source_state(SRC_WS)
+    state_ws_status = Source_state(SRC_WS_STATUS)
+    info_values_status = Source_values(SRC_STATUS)
+    info_values_coap = Source_values(SRC_COAP)
+    info_values_mqtt = Source_values(SRC_MQTT)
+    info_values_mqtt_status = Source_values(SRC_MQTT_STATUS)
+    info_values_ws = Source_values(SRC_WS)
+    info_values_ws_status = Source_values(SRC_WS_STATUS)
+    info_values_updated = Source_values(None)
+
     def __init__(self):
         self.info_values = {}
-        self.info_values_updated = {}
         self._info_value_cfg = {}
-        self.info_values_status = {}
-        self.info_values_coap = {}
-        self.info_values_mqtt = {}
-        self.info_values_mqtt_status = {}
-        self.info_values_ws = {}
-        self.info_values_ws_status = {}
+        self._fields = field_table(type(self))
+        self._updated = []
+        self._source_values = None
+        self._states = None
         self._state_cfg = None
-        self.state_status = None
-        self.state_coap = None
-        self.state_mqtt = None
-        self.state_mqtt_status = None
-        self.state_ws = None
-        self.state_ws_status = None
         self._channel = 0
+        self._state_ext = None
+        self._info_ext = None
+        self._sensor_ids = None
         self.cb_updated = []
+        #Called with (obj, {name: src}) of the values changed since last
+        #update, name is 'state' for the state
+        self.cb_changed = []
+        self._changes = None
         self.need_update = False
         self.lazy_load = False
         self.debug = True
+        self._coalescer = None
+        self._update_window = None
+        self._deadband = None
+        self._sent_values = None
 
     def raise_updated(self, force=False):
         if not force and not self.need_update:
             return
         self.need_update = False
+        coalescer = self._coalescer
+        if coalescer is not None:
+            window = self._update_window
+            self._update_window = None
+            if not force:
+                coalescer.add(self, window)
+                return
+            coalescer.discard(self)
+        self._notify_updated()
+
+    def _notify_updated(self):
+        changes, self._changes = self._changes, None
         for callback in self.cb_updated:
             callback(self)
+        if self.cb_changed:
+            changes = changes or {}
+            for callback in self.cb_changed:
+                callback(self, changes)
+
+    def _changed(self, name, value, src):
+        """Collect change for cb_changed and the coalesce window"""
+        if self.cb_changed:
+            if self._changes is None:
+                self._changes = {}
+            self._changes[name] = src
+        if self._coalescer is not None:
+            window = self._coalescer.get_window(name, value)
+            if self._update_window is None or window < self._update_window:
+                self._update_window = window
+
+    def _compile_cfg(self):
+        """Compile the value cfgs, call again when a cfg has changed"""
+        self._state_ext = compile_cfg(self._state_cfg, self._channel) \
+            if self._state_cfg else None
+        self._info_ext = compile_cfgs(self._info_value_cfg, self._channel)
+        if self._sensor_ids is not None:
+            self._resolve_coap_positions(self._sensor_ids)
+
+    def _resolve_coap_positions(self, sensor_ids):
+        """Only use the CoAP positions listed in /cit/d"""
+        self._sensor_ids = sensor_ids
+        if self._info_ext is None:
+            return
+        if self._state_ext:
+            self._state_ext = self._state_ext.resolve_coap(sensor_ids)
+        self._info_ext = [(name, ext.resolve_coap(sensor_ids))
+                          for name, ext in self._info_ext]
 
-    def _fmt_info_value(self, value, cfg, prefix):
-        fmt_list = cfg.get(ATTR_FMT, None)
-        if type(fmt_list) is dict:
-            fmt_list = fmt_list.get(prefix)
-        if fmt_list:
-            if not type(fmt_list) is list:
-                fmt_list = [fmt_list]
-            for fmt in fmt_list:
-                if fmt is None:
-                    continue
-                if callable(fmt):
-                    value = fmt(value)
-                    continue
-                params = fmt.split(':')
-                cmd = params[0]
-                if cmd == 'bool':
-                    if value=='on':
-                        value = True
-                    elif value=='off':
-                        value = False
-                    else:
-                        value = int(value) > 0
-                elif cmd == "round":
-                    if len(params)>1:
-                        value = round(value, int(params[1]))
-                    else:
-                        value = round(value)
-                elif cmd == "float":
-                    value = float(value)
-                elif cmd[0] == '/':
-                    div = int(fmt[1:])
-                    value = value / div
-                elif cmd == "ver":
-                    value = self.parent._firmware_mgr.format(value)
-                                                
-        return value
-
-    def _get_status_value(self, status, cfg):
-        value = status
-        path = cfg.get(ATTR_PATH)
-        if not path:
-            return None
-        for key in path.split('/'):
-            if value is not None:
-                if key == '$':
-                    ch = cfg.get(ATTR_CHANNEL, self._channel)
-                    value = value[ch]
-                else:
-                    value = value.get(key, None)
-        return value
+    def coap_positions(self):
+        """CoAP positions read by update_coap, None if any can be used"""
+        return None if hasattr(self, 'update_coap') else ()
 
-    def _update_state(self, status, cfg, src):
-        value = self._get_status_value(status, cfg)
-        if value is not None:
-            value = self._fmt_info_value(value, cfg, src)
-            self._set_state(value, src)
+    def mqtt_topics(self):
+        """MQTT topics read by update_mqtt, None if any can be used"""
+        return None if hasattr(self, 'update_mqtt') else ()
 
-    def _update_info_value(self, name, status, cfg, src):
-        value = self._get_status_value(status, cfg)
-        if value is not None:
-            value = self._fmt_info_value(value, cfg, src)
-            self.set_info_value(name, value, src)
-            # if self.info_values.get(name) != value:
-            #     self.info_values[name] = value
-            #     self.need_update = True
-            # self.info_values_updated[name] = datetime.now()
-            # self.info_values_status[name] = value
+    def rpc_components(self):
+        """Gen2 components read by update_rpc and rpc_event, None if any"""
+        return None if hasattr(self, 'update_rpc') \
+            or hasattr(self, 'rpc_event') else ()
 
-    def _get_coap_value(self, cfg, payload):
-        if ATTR_POS in cfg:
-            pos_list = cfg[ATTR_POS]
-            if not type(pos_list) is list:
-                pos_list = [pos_list]
-            for _pos in pos_list:
-                ch = cfg.get(ATTR_CHANNEL, self._channel)
-                if _pos < 1000:
-                    pos = _pos + 10 * ch
-                else:
-                    pos = _pos + 100 * ch
-                if pos in payload:
-                    value = payload.get(pos)
-                    value = self._fmt_info_value(value, cfg, SRC_COAP)
-                    return value
-        return None
+    def _coap_pos(self, pos_list, channel=None):
+        """Positions used by coap_get with the same arguments"""
+        return expand_coap_pos(pos_list, channel or self._channel or 0)
 
-    def __update_info_values_coap(self, payload, cfg):
-        for name, cfg in cfg.items():
-            value = self._get_coap_value(cfg, payload)
-            self.set_info_value(name, value, SRC_COAP)
-            # if value is not None:
-            #     self.info_values_updated[name] = datetime.now()
-            #     self.info_values_coap[name] = value
-            #     if self.info_values.get(name) != value:
-            #         self.info_values[name] = value
-            #         self.need_update = True
+    def _get_rpc_value(self, cfg, rpc_data):
+        return compile_cfg(cfg, self._channel).get_rpc(rpc_data)
 
     def _set_state(self, new_state, src):
         if not new_state is None:
-            if src == SRC_COAP:
-                self.state_coap = new_state
-            if src == SRC_STATUS:
-                self.state_status = new_state
-            if src == SRC_MQTT:
-                self.state_mqtt = new_state
-            if src == SRC_MQTT_STATUS:
-                self.state_mqtt_status = new_state
-            if src == SRC_WS:
-                self.state_ws = new_state
-            if src == SRC_WS_STATUS:
-                self.state_ws_status = new_state
-            if self.debug:
+            slot = SOURCE_SLOTS.get(src)
+            if slot is not None:
+                if self._states is None:
+                    self._states = [None] * len(SOURCE_SLOTS)
+                self._states[slot] = new_state
+            deadband = self._deadband
+            if deadband is not None and not deadband.covers('state'):
+                deadband = None
+            if self.debug and deadband is None:
                 self.need_update = True
-            if self.state != new_state:
+            changed = self.state != new_state
+            if changed:
                 self.state = new_state
+            if deadband is not None:
+                changed = deadband.significant(self, 'state', new_state,
+                                               changed)
+            if changed:
                 self.need_update = True
+                if self._coalescer is not None or self.cb_changed:
+                    self._changed('state', new_state, src)
             if self.lazy_load:
                 self.lazy_load = False
                 self.block.parent.callback_add_device(self)
 
-    def _update_info_values_coap(self, payload, extra_info_value_cfg=None):
-        if self._state_cfg:
-            new_state = self._get_coap_value(self._state_cfg, payload)
-            self._set_state(new_state, SRC_COAP)
-        if extra_info_value_cfg:
-            self.__update_info_values_coap(payload, extra_info_value_cfg)
-        if self._info_value_cfg:
-            self.__update_info_values_coap(payload, self._info_value_cfg)
-
-    def _get_mqtt_value(self, cfg, payload):
-        payload_topic = payload['topic']            
-        if ATTR_TOPIC in cfg:
-            topic_list = cfg[ATTR_TOPIC]
-            if not type(topic_list) is list:
-                topic_list = [topic_list]
-            for topic in topic_list:
-                if payload_topic == 'status':
-                    if topic[0]=='@':
-                        if not 'json_data' in payload:
-                            payload['json_data'] = json.loads(payload['data'])
-                        return self._fmt_info_value(payload['json_data'][topic[1:]], cfg, SRC_MQTT)
-                else:                                
-                    topic = topic.replace('$', str(cfg.get(ATTR_CHANNEL, self._channel))) #Todo cache??
-                    if payload_topic == topic:         
-                        return self._fmt_info_value(payload['data'], cfg, SRC_MQTT)                
-
-    def _update_info_values_mqtt(self, payload, extra_info_value_cfg=None):                
-        if self._state_cfg:
-            new_state = self._get_mqtt_value(self._state_cfg, payload)
-            self._set_state(new_state, SRC_MQTT)
-        if extra_info_value_cfg:
-            for name, cfg in extra_info_value_cfg.items():
-                value = self._get_mqtt_value(cfg, payload)
-                self.set_info_value(name, value, SRC_MQTT)                  
-        if self._info_value_cfg:
-            for name, cfg in self._info_value_cfg.items():
-                value = self._get_mqtt_value(cfg, payload)
-                self.set_info_value(name, value, SRC_MQTT)
-
-    def _get_rpc_value(self, cfg, rpc_data):
-        if ATTR_RPC in cfg:            
-            rpc_list = cfg[ATTR_RPC]
-            if not type(rpc_list) is list:
-                rpc_list = [rpc_list]
-            for rpc in rpc_list:
-                rpc = rpc.replace('$', str(cfg.get(ATTR_CHANNEL, self._channel))) #Todo cache??
-                value = rpc_data 
-                for key in rpc.split('/'):
-                    if value is not None:
-                        if key.startswith('include:'):
-                            value = (key[8:] in value)
-                        else:
-                            value = value.get(key, None)
-                if value != None:
-                    return self._fmt_info_value(value, cfg, SRC_MQTT)  
-
-    def _update_info_values_rpc(self, rpc_data, src, extra_info_value_cfg=None):                
-        if self._state_cfg:
-            new_state = self._get_rpc_value(self._state_cfg, rpc_data)
-            self._set_state(new_state, src)
-        if extra_info_value_cfg:
-            for name, cfg in extra_info_value_cfg.items():
-                value = self._get_rpc_value(cfg, rpc_data)
-                self.set_info_value(name, value, src)                  
-        if self._info_value_cfg:
-            for name, cfg in self._info_value_cfg.items():
-                value = self._get_rpc_value(cfg, rpc_data)
-                self.set_info_value(name, value, src)
+    def _update_info_values_coap(self, payload, extra_ext=None, time=None):
+        if self._info_ext is None:
+            self._compile_cfg()
+        if self._state_ext:
+            self._set_state(self._state_ext.get_coap(payload), SRC_COAP)
+        if extra_ext:
+            for name, ext in extra_ext:
+                self.set_info_value(name, ext.get_coap(payload), SRC_COAP,
+                                    time)
+        for name, ext in self._info_ext:
+            self.set_info_value(name, ext.get_coap(payload), SRC_COAP, time)
+
+    def _update_info_values_status(self, status, src, extra_ext=None,
+                                   time=None):
+        if self._info_ext is None:
+            self._compile_cfg()
+        if self._state_ext:
+            self._set_state(self._state_ext.get_status(status, src), src)
+        if extra_ext:
+            for name, ext in extra_ext:
+                self.set_info_value(name, ext.get_status(status, src), src,
+                                    time)
+        for name, ext in self._info_ext:
+            self.set_info_value(name, ext.get_status(status, src), src, time)
 
     #Todo: remove
     def coap_get(self, payload, pos_list, default=None, channel=None):
@@ -255,25 +206,38 @@ class Base(object):
                 return payload[pos]
         return default
 
-    def set_info_value(self, name, value, src):
+    def set_info_value(self, name, value, src, time=None):
+        """Set value from src, time is shared by the values of a message"""
         if value is None:
             return
-        if self.info_values.get(name) != value:
-            self.need_update = True
+        changed = self.info_values.get(name) != value
+        if changed:
             self.info_values[name] = value
-        self.info_values_updated[name] = datetime.now()
-        if src == SRC_STATUS:
-            self.info_values_status[name] = value
-        elif src == SRC_COAP:
-            self.info_values_coap[name] = value
-        elif src == SRC_MQTT:
-            self.info_values_mqtt[name] = value
-        elif src == SRC_MQTT_STATUS:
-            self.info_values_mqtt_status[name] = value
-        elif src == SRC_WS:
-            self.info_values_ws[name] = value
-        elif src == SRC_WS_STATUS:
-            self.info_values_ws_status[name] = value
+        if self._deadband is not None:
+            changed = self._deadband.significant(self, name, value, changed)
+        if changed:
+            self.need_update = True
+            if self._coalescer is not None or self.cb_changed:
+                self._changed(name, value, src)
+        field_id = self._fields.ids.get(name)
+        if field_id is None:
+            field_id = self._fields.get_id(name)
+        updated = self._updated
+        if field_id < len(updated):
+            updated[field_id] = time or datetime.now()
+        else:
+            put(updated, field_id, time or datetime.now())
+        slot = SOURCE_SLOTS.get(src)
+        if slot is not None:
+            if self._source_values is None:
+                self._source_values = [None] * len(SOURCE_SLOTS)
+            values = self._source_values[slot]
+            if values is None:
+                values = self._source_values[slot] = []
+            if field_id < len(values):
+                values[field_id] = value
+            else:
+                put(values, field_id, value)
         #if self.debug:
         #    self.need_update = True
 
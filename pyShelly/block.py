@@ -3,9 +3,11 @@
 
 from distutils.log import debug
 import json
+import threading
 from datetime import datetime
 
 from .utils import shelly_http_get, timer
+from .compat import s
 from .switch import Switch
 from .relay import Relay
 from .powermeter import PowerMeter
@@ -17,6 +19,9 @@ from .dimmer import Dimmer
 from .roller import Roller
 from .utils import exception_log
 from .base import Base
+from .extractor import compile_cfgs
+from .status_tree import Status_tree
+from .executor import PRIORITY_COMMAND, PRIORITY_POLL
 from .ws_client import WebSocket
 
 from .const import (
@@ -49,6 +54,7 @@ from .const import (
     ATTR_RPC,
     BLOCK_INFO_VALUES,
     SHELLY_TYPES,
+    SRC_COAP,
     SRC_STATUS,
     SRC_MQTT,
     SRC_MQTT_STATUS,
@@ -56,8 +62,24 @@ from .const import (
 )
 
 class Block(Base):
+    __slots__ = ('id', 'unit_id', 'type', 'rpc', 'parent', 'ip_addr', 'devices',
+                 'discovery_src', 'protocols', 'unavailable_after_sec',
+                 'last_update_status_info', 'update_status_interval', 'reload',
+                 'last_updated', 'last_push', 'last_coap', 'error', 'discover_by_mdns',
+                 'last_coap_unicast', 'discover_by_coap', 'sleep_device', 'payload', 'settings',
+                 'exclude_info_values', 'websocket', '_payload_hash',
+                 'payload_unchanged_cnt', '_need_setup_delayed_devices',
+                 '_cnt_setup_delayed_devices', '_cit_key', '_block_ext',
+                 '_coap_index', '_mqtt_index', '_rpc_index', '_status_tree',
+                 '_check_cit_timer', '_available', 'status_update_error_cnt',
+                 'last_try_update_status', '_last_friendly_name', 'mqtt_name',
+                 'mqtt_last_seen', 'mqtt_src', '_check_delay_load',
+                 '_need_setup_devices')
+
     def __init__(self, parent, block_id, block_type, ip_addr, discovery_src):
         super(Block, self).__init__()
+        self._coalescer = parent._coalescer
+        self._deadband = parent._deadband
         self.id = block_id
         self.unit_id = block_id
         self.type = block_type
@@ -73,6 +95,11 @@ class Block(Base):
         self.last_update_status_info = None
         self.reload = False
         self.last_updated = None #datetime.now()
+        #Last CoAP, MQTT or WebSocket message not asked for by a poll
+        self.last_push = None
+        self.last_coap = None
+        #Last CoAP sent to this host and not to the multicast group
+        self.last_coap_unicast = None
         self.error = None
         self.discover_by_mdns = False
         self.discover_by_coap = False
@@ -82,8 +109,17 @@ class Block(Base):
         self.exclude_info_values = []
         self.websocket = None
         #self._info_value_cfg = None
+        self._payload_hash = {}
+        self.payload_unchanged_cnt = 0
         self._need_setup_delayed_devices = False
         self._cnt_setup_delayed_devices = 0
+        self._cit_key = None
+        self._block_ext = None
+        self._coap_index = None
+        self._mqtt_index = None
+        self._rpc_index = None
+        self._status_tree = Status_tree()
+        self._check_cit_timer = timer(600)
         self.setup_devices()
         self._available = None
         self.status_update_error_cnt = 0
@@ -94,16 +130,201 @@ class Block(Base):
         self.mqtt_src = None        
         self._check_delay_load = timer(1)
 
+    def payload_unchanged(self, key, payload):
+        """Return True if payload is same as last one from this source
+
+        Only last_updated is refreshed for an unchanged payload, the
+        caller should skip decoding and dispatching it.
+        """
+        fingerprint = hash(payload)
+        if self._payload_hash.get(key) == fingerprint:
+            self.last_updated = datetime.now()
+            self.payload_unchanged_cnt += 1
+            self.parent.payload_unchanged_cnt += 1
+            return True
+        self._payload_hash[key] = fingerprint
+        return False
+
+    def update_cit(self, payload):
+        """Device description (/cit/d) received by CoAP discovery"""
+        if not self.fw_version():
+            #Cached per firmware, fetched by _check_cit when known
+            return
+        try:
+            cit = json.loads(payload)
+        except ValueError:
+            return
+        key = self.parent._cit_cache.key(self.type, self.fw_version())
+        if key != self._cit_key:
+            self._apply_cit(key, self.parent._cit_cache.put(key, cit))
+
+    def _check_cit(self):
+        """Resolve CoAP positions, fetch /cit/d once per type and fw"""
+        if not self.fw_version():
+            return
+        key = self.parent._cit_cache.key(self.type, self.fw_version())
+        if key == self._cit_key:
+            return
+        sensor_ids = self.parent._cit_cache.get(key)
+        if sensor_ids is not None:
+            self._apply_cit(key, sensor_ids)
+        elif not self.sleep_device and self.ip_addr \
+                and self._check_cit_timer.check():
+            executor = self.parent._poll_executor
+            if executor:
+                executor.submit(self.id, PRIORITY_POLL, self._fetch_cit,
+                                key, unique=('cit', self.id))
+            else:
+                thread = threading.Thread(target=self._fetch_cit, args=(key,))
+                thread.name = "S4H-Cit"
+                thread.daemon = True
+                thread.start()
+
+    def _fetch_cit(self, key):
+        success, cit = self.http_get("/cit/d", False)
+        if not success or not isinstance(cit, dict):
+            return
+        self._apply_cit(key, self.parent._cit_cache.put(key, cit))
+
+    def _apply_cit(self, key, sensor_ids):
+        self._cit_key = key
+        self._coap_index = None
+        self._mqtt_index = None
+        self._rpc_index = None
+        self._resolve_coap_positions(sensor_ids)
+        for dev in self.devices:
+            dev._resolve_coap_positions(sensor_ids)
+
+    def _compile_cfg(self):
+        self._block_ext = compile_cfgs(BLOCK_INFO_VALUES, self._channel)
+        self._mqtt_index = None
+        self._rpc_index = None
+        super(Block, self)._compile_cfg()
+
+    def _resolve_coap_positions(self, sensor_ids):
+        super(Block, self)._resolve_coap_positions(sensor_ids)
+        if self._block_ext:
+            self._block_ext = [(name, ext.resolve_coap(sensor_ids))
+                               for name, ext in self._block_ext]
+
+    def _build_coap_index(self):
+        """List (device, CoAP positions it reads) for the devices
+
+        Positions is None for a device with an update_coap not declaring
+        its positions, it is updated by every message.
+        """
+        index = []
+        for dev in self.devices:
+            if dev._info_ext is None:
+                dev._compile_cfg()
+            positions = dev.coap_positions()
+            if positions is not None:
+                positions = set(positions)
+                if dev._state_ext:
+                    positions.update(dev._state_ext.coap_pos)
+                for _, ext in dev._info_ext:
+                    positions.update(ext.coap_pos)
+                positions = frozenset(positions)
+            index.append((dev, positions))
+        self._coap_index = index
+
+    def _build_mqtt_index(self):
+        """Dict topic -> [(obj, [(name, ext)], call update_mqtt)]
+
+        Name is None for the state. Values from the @field of the status
+        JSON are under topic 'status'. Devices with an update_mqtt not
+        declaring its topics get every topic, the None key holds the
+        handlers for topics without values.
+        """
+        if self._info_ext is None:
+            self._compile_cfg()
+        entries = []
+        all_topics = set()
+        for obj in [self] + self.devices:
+            if obj._info_ext is None:
+                obj._compile_cfg()
+            fields = [(None, obj._state_ext)] if obj._state_ext else []
+            if obj is self:
+                fields.extend(self._block_ext)
+            fields.extend(obj._info_ext)
+            by_topic = {}
+            for name, ext in fields:
+                topics = [topic for topic in ext.topics if topic[0] != '@']
+                if ext.status_key is not None:
+                    topics.append('status')
+                for topic in topics:
+                    by_topic.setdefault(topic, []).append((name, ext))
+            custom = obj.mqtt_topics() if obj is not self else ()
+            all_topics.update(by_topic)
+            all_topics.update(custom or ())
+            entries.append((obj, by_topic, custom))
+        index = {}
+        for topic in list(all_topics) + [None]:
+            handlers = []
+            for obj, by_topic, custom in entries:
+                fields = by_topic.get(topic, ())
+                call = custom is None or topic in custom
+                if fields or call:
+                    handlers.append((obj, fields, call))
+            index[topic] = handlers
+        self._mqtt_index = index
+
+    def _build_rpc_index(self):
+        """Index Gen2 handlers by top level key, like 'switch:0'
+
+        Block values key -> [(name, ext)], device values key ->
+        [(dev, name, ext)] with name None for the state, update_rpc key ->
+        [dev] and rpc_event component -> [dev]. The None key of the last
+        two holds the devices reading any component.
+        """
+        if self._info_ext is None:
+            self._compile_cfg()
+        block_fields = {}
+        for name, ext in self._block_ext + self._info_ext:
+            for path in ext.rpc_paths:
+                block_fields.setdefault(path[0][0], []).append((name, ext))
+        dev_fields = {}
+        calls = {None: []}
+        events = {None: []}
+        declared = []
+        for dev in self.devices:
+            if dev._info_ext is None:
+                dev._compile_cfg()
+            fields = [(None, dev._state_ext)] if dev._state_ext else []
+            for name, ext in fields + dev._info_ext:
+                for path in ext.rpc_paths:
+                    dev_fields.setdefault(path[0][0], []) \
+                        .append((dev, name, ext))
+            comps = dev.rpc_components()
+            declared.append((dev, comps))
+            if hasattr(dev, 'update_rpc'):
+                for comp in comps if comps is not None else [None]:
+                    calls.setdefault(comp, []).append(dev)
+            if hasattr(dev, 'rpc_event'):
+                for comp in comps or ():
+                    events[comp] = []
+        #Devices reading any component are in the list of every component
+        for comp, devs in events.items():
+            devs.extend(dev for dev, comps in declared
+                        if hasattr(dev, 'rpc_event')
+                        and (comps is None or comp in comps))
+        self._rpc_index = (block_fields, dev_fields, calls, events)
+
     def update_coap(self, payload, ip_addr):
         self.ip_addr = ip_addr  # If changed ip
-        self.last_updated = datetime.now()
-        self._update_info_values_coap(payload, BLOCK_INFO_VALUES)   
+        self.last_updated = now = datetime.now()
+        self._update_info_values_coap(payload, self._block_ext, now)
 
         if self.payload:
             self.set_info_value(INFO_VALUE_PAYLOAD, self.payload, None)
-     
-        for dev in self.devices:
-            dev._update_info_values_coap(payload)
+
+        if self._coap_index is None:
+            self._build_coap_index()
+        for dev, positions in self._coap_index:
+            #Skip devices without any of their positions in the message
+            if positions is not None and positions.isdisjoint(payload):
+                continue
+            dev._update_info_values_coap(payload, time=now)
             if hasattr(dev, 'update_coap'):
                 dev.update_coap(payload)
             dev.raise_updated()
@@ -117,30 +338,60 @@ class Block(Base):
         #     self.reload = False
         self.raise_updated()
 
-    def update_rpc(self, rpc_data, src):
-        self.last_updated = datetime.now()
-        ipaddr = self._get_rpc_value({ATTR_RPC:'wifi/sta_ip'}, rpc_data)
-        if ipaddr:
-            self.ip_addr=ipaddr
-        self._update_info_values_rpc(rpc_data, src, BLOCK_INFO_VALUES)
+    def update_rpc(self, rpc_data, src, full=False):
+        """Merge full status or delta into the status tree
+
+        Only the values with a changed path are read, from the tree.
+        """
+        self.last_updated = now = datetime.now()
+        if 'wifi' in rpc_data:
+            ipaddr = self._get_rpc_value({ATTR_RPC:'wifi/sta_ip'}, rpc_data)
+            if ipaddr:
+                self.ip_addr=ipaddr
+        changed = self._status_tree.update(rpc_data, full)
+        if self._rpc_index is None:
+            self._build_rpc_index()
+            #New handlers read all values
+            changed = self._status_tree.all_paths()
+        tree = self._status_tree.data
+        block_fields, dev_fields, calls, events = self._rpc_index
+        for key, key_changed in changed.items():
+            for name, ext in block_fields.get(key, ()):
+                if ext.reads_rpc(key_changed):
+                    self.set_info_value(name, ext.get_rpc(tree), src, now)
         if 'events' in rpc_data:
-            events = rpc_data['events']
-            for event in events:
+            for event in rpc_data['events']:
                 comp = event.get("component")
                 type = event.get("event")
-                for dev in self.devices:
-                    if hasattr(dev, 'rpc_event'):
-                        dev.rpc_event(comp, type)
+                devs = events.get(comp)
+                for dev in devs if devs is not None else events[None]:
+                    dev.rpc_event(comp, type)
 
         self._update_infovalues(src)
 
         force_update_devices = self.need_update #Block updated
         self.raise_updated()
-        
-        for dev in self.devices:
-            dev._update_info_values_rpc(rpc_data, src)
-            if hasattr(dev, 'update_rpc'):
+
+        #Devices touched by the message, True if update_rpc is called
+        touched = {}
+        for key, key_changed in changed.items():
+            for dev, name, ext in dev_fields.get(key, ()):
+                if not ext.reads_rpc(key_changed):
+                    continue
+                if name is None:
+                    dev._set_state(ext.get_rpc(tree), src)
+                else:
+                    dev.set_info_value(name, ext.get_rpc(tree), src, now)
+                touched.setdefault(dev, False)
+        for key in rpc_data:
+            for dev in calls.get(key, ()):
+                touched[dev] = True
+        for dev in calls[None]:
+            touched[dev] = True
+        for dev, call in touched.items():
+            if call:
                 dev.update_rpc(rpc_data, src)
+        for dev in self.devices if force_update_devices else touched:
             dev.raise_updated(force_update_devices)
         self.raise_updated()
 
@@ -156,8 +407,13 @@ class Block(Base):
         self.mqtt_name = payload['name']
         self.mqtt_last_seen = datetime.now() 
         self.mqtt_src = payload['src']
-        self.last_updated = datetime.now()
+        self.last_updated = now = datetime.now()
         topic = payload['topic']
+        if topic != "announce" and not self.rpc:
+            self.last_push = now
+        if topic != "announce" and \
+                self.payload_unchanged((SRC_MQTT, topic), payload['data']):
+            return
         if topic == "info":
             status = json.loads(payload['data'])
             self._update_status_info(status, SRC_MQTT_STATUS)
@@ -166,22 +422,38 @@ class Block(Base):
         else:
             if self.rpc:
                 data = json.loads(payload['data'])
+                full = data.get('method') == 'NotifyFullStatus'
+                if 'params' in data:
+                    self.last_push = now
                 data = data['params'] if 'params' in data else data
                 data = data['result'] if 'result' in data else data
-                self.update_rpc(data, SRC_MQTT)
+                self.update_rpc(data, SRC_MQTT, full)
             else:
-                self._update_info_values_mqtt(payload, BLOCK_INFO_VALUES)
-                for dev in self.devices:
-                    dev._update_info_values_mqtt(payload)
-                    if hasattr(dev, 'update_mqtt'):
-                        dev.update_mqtt(payload)
-                    dev.raise_updated()
+                if self._mqtt_index is None:
+                    self._build_mqtt_index()
+                handlers = self._mqtt_index.get(topic)
+                if handlers is None:
+                    handlers = self._mqtt_index[None]
+                for obj, fields, call in handlers:
+                    for name, ext in fields:
+                        if name is None:
+                            obj._set_state(ext.get_mqtt(payload), SRC_MQTT)
+                        else:
+                            obj.set_info_value(name, ext.get_mqtt(payload),
+                                               SRC_MQTT, now)
+                    if call:
+                        obj.update_mqtt(payload)
+                    if obj is not self:
+                        obj.raise_updated()
                 self.raise_updated()
 
     def loop(self):
         if self.websocket:
             self.websocket.check()
 
+        if not self.rpc:
+            self._check_cit()
+
         if self._need_setup_delayed_devices and self._check_delay_load.check():
             self._cnt_setup_delayed_devices += 1
             if self._cnt_setup_delayed_devices == 10:
@@ -237,7 +509,13 @@ class Block(Base):
 
             LOGGER.debug("Get status from %s %s", self.id, self.friendly_name())
             url = "/rpc/Shelly.GetStatus" if self.rpc else "/status"
-            success, status = self.http_get(url, False)
+            success, body = self.http_get(url, False, raw=True)
+            status = None
+            if success:
+                try:
+                    status = json.loads(s(body))
+                except ValueError:
+                    success = False
 
             if not success or status == {}:
                 self.status_update_error_cnt += 1
@@ -248,8 +526,11 @@ class Block(Base):
 
             self.status_update_error_cnt = 0
 
+            if self.payload_unchanged(SRC_STATUS, body):
+                return
+
             if self.rpc:
-                self.update_rpc(status, SRC_STATUS)
+                self.update_rpc(status, SRC_STATUS, True)
             else:
                 self._update_status_info(status, SRC_STATUS)
 
@@ -286,7 +567,7 @@ class Block(Base):
             self.need_update=True
 
     def _update_status_info(self, status, src):
-        self.last_updated = datetime.now()
+        self.last_updated = now = datetime.now()
 
         if 'wifi_sta' in status:
             wifi = status['wifi_sta']
@@ -294,14 +575,9 @@ class Block(Base):
                 self.ip_addr = wifi['ip']   
 
         #Put status in info_values
-        for name, cfg in BLOCK_INFO_VALUES.items():
-            if name in self.exclude_info_values:
-                continue
-            self._update_info_value(name, status, cfg, src)
-
-        if self._info_value_cfg:
-            for name, cfg in self._info_value_cfg.items():
-                self._update_info_value(name, status, cfg, src)
+        self._update_info_values_status(status, src, [
+            (name, ext) for name, ext in self._block_ext
+            if name not in self.exclude_info_values], now)
 
         self._update_infovalues(src)
         
@@ -310,24 +586,29 @@ class Block(Base):
 
         for dev in self.devices:
             try:
-                if dev._state_cfg:
-                    dev._update_state(status, dev._state_cfg, src)
-                if dev._info_value_cfg:
-                    for name, cfg in dev._info_value_cfg.items():
-                        dev._update_info_value(name, status, cfg, src)
+                dev._update_info_values_status(status, src, time=now)
                 dev.update_status_information(status, src)
                 dev.raise_updated(force_update_devices)
             except Exception as ex:
                 exception_log(ex, "Error update device status: {} {}", \
                     dev.id, dev.type)
 
-    def http_get(self, url, log_error=True):
+    def http_get(self, url, log_error=True, raw=False):
         """Send HTTP GET request"""
         success, res = shelly_http_get(self.ip_addr, url, \
                               self.parent.username, self.parent.password, \
-                              log_error)
+                              log_error, raw)
         return success, res
 
+    def send_http(self, url):
+        """Send HTTP GET command, before queued polls if started"""
+        executor = self.parent._poll_executor
+        if executor:
+            return executor.submit(self.id, PRIORITY_COMMAND, self.http_get,
+                                   url)
+        success, _ = self.http_get(url)
+        return success
+
     def update_firmware(self, beta = False):
         """Start firmware update"""
         url = None
@@ -645,10 +926,22 @@ class Block(Base):
         if (self.rpc):
             self.websocket = WebSocket(self)
 
+        self._compile_cfg()
+
     def _add_device(self, dev, lazy_load=False, major=False):
         dev.lazy_load = lazy_load
         dev.major_unit = major
         self.devices.append(dev)
+        self._coap_index = None
+        self._mqtt_index = None
+        self._rpc_index = None
+        if self._sensor_ids is not None:
+            dev._resolve_coap_positions(self._sensor_ids)
+        dev._compile_cfg()
+        if self._info_ext is not None:
+            #Cfg of block can be changed by device, like voltage_to_block
+            self._compile_cfg()
+        self._payload_hash.clear() #New device need next payload
         self.parent.add_device(dev, self.discovery_src)
         return dev
 
@@ -657,6 +950,9 @@ class Block(Base):
             self.parent.remove_device(device, self.discovery_src)
             device.close()
         self.devices = []
+        self._coap_index = None
+        self._mqtt_index = None
+        self._rpc_index = None
         #self.setup_devices()
         self._need_setup_devices = True
 
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except, invalid-name
+"""Record received CoAP, MQTT and WebSocket traffic and replay it
+
+The capture file starts with CAPTURE_MAGIC followed by records of
+timestamp, kind, meta and data, both length prefixed. Meta is the
+source ip, for MQTT also the topic and the MQTT source name, for
+WebSocket the block id and type.
+
+    python -m pyShelly.capture capture.s4h [--realtime]
+"""
+
+import argparse
+import logging
+import struct
+import threading
+import time
+
+from .compat import s, byte_view
+
+CAPTURE_MAGIC = b'S4HCAP1\n'
+
+KIND_COAP = 1
+KIND_MQTT = 2
+KIND_WS = 3
+
+KIND_NAMES = {KIND_COAP: 'CoAP', KIND_MQTT: 'MQTT', KIND_WS: 'WebSocket'}
+
+_HEADER = struct.Struct('<dBHI')
+
+class Recorder():
+    """Write received payloads to a capture file, thread safe"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb')
+        self._file.write(CAPTURE_MAGIC)
+
+    def record(self, kind, ipaddr, data, *fields):
+        """Write data with ipaddr and the fields of the kind as meta"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        meta = '\0'.join((ipaddr or '',) + tuple(field or ''
+                                                   for field in fields))
+        meta = meta.encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(_HEADER.pack(time.time(), kind,
+                                          len(meta), len(data)))
+            self._file.write(meta)
+            self._file.write(data)
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+def read_capture(path):
+    """Yield (timestamp, kind, ipaddr, fields, data) from a capture"""
+    with open(path, 'rb') as capture:
+        if capture.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError("Not a pyShelly capture file: " + path)
+        while True:
+            header = capture.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            timestamp, kind, meta_len, data_len = _HEADER.unpack(header)
+            meta = capture.read(meta_len).decode('utf-8').split('\0')
+            data = capture.read(data_len)
+            if len(data) < data_len:
+                return
+            yield timestamp, kind, meta[0], meta[1:], data
+
+def _ws_block(root, ipaddr, fields):
+    """Block of a WebSocket record, added if not known yet"""
+    if not fields or not fields[0]:
+        #Recorded without block id
+        return next((block for block in list(root.blocks.values())
+                     if block.ip_addr == ipaddr), None)
+    block_id = fields[0].upper()
+    if block_id not in root.blocks:
+        device_type = fields[1] if len(fields) > 1 else None
+        root.update_block(block_id, device_type, ipaddr, 'Replay', None)
+    return root.blocks.get(block_id)
+
+def replay(root, path, realtime=False):
+    """Push a capture through pyShelly without any sockets
+
+    Returns a dict with number of messages per kind. With realtime the
+    recorded pace is kept, otherwise replay runs at maximum speed.
+    """
+    counts = {kind: 0 for kind in KIND_NAMES}
+    mqtt = {'Server': root._mqtt_server, 'Client': root._mqtt_client}
+    first = start = None
+    for timestamp, kind, ipaddr, fields, data in read_capture(path):
+        if realtime:
+            if first is None:
+                first, start = timestamp, time.time()
+            delay = (timestamp - first) - (time.time() - start)
+            if delay > 0:
+                time.sleep(delay)
+        if kind == KIND_COAP:
+            root._coap._process(byte_view(data), ipaddr)
+        elif kind == KIND_MQTT:
+            topic, src = fields[0], fields[1]
+            mqtt.get(src, root._mqtt_server).receive_msg(topic, s(data))
+        elif kind == KIND_WS:
+            block = _ws_block(root, ipaddr, fields)
+            if block is None or block.websocket is None:
+                continue
+            #Frames go to the RPC handler, nothing is connected
+            block.websocket.on_message(None, data.decode('utf-8'))
+        else:
+            continue
+        counts[kind] += 1
+    return counts
+
+def main(argv=None):
+    from . import pyShelly
+    parser = argparse.ArgumentParser(
+        prog="python -m pyShelly.capture",
+        description="Replay a pyShelly capture and report dispatch speed")
+    parser.add_argument('path', help="capture file")
+    parser.add_argument('--realtime', action='store_true',
+                        help="keep recorded pace instead of maximum speed")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    root = pyShelly()
+    root.websocket_enabled = False
+    start = time.time()
+    counts = replay(root, args.path, args.realtime)
+    sec = time.time() - start
+    total = sum(counts.values())
+    for kind, name in KIND_NAMES.items():
+        print("%-10s %8d" % (name, counts[kind]))
+    print("%d messages in %.3f s, %.0f messages/s, %d blocks, %d devices"
+          % (total, sec, total / sec if sec else 0, len(root.blocks),
+             len(root.devices)))
+    root.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except
+"""Cache of CoIoT device descriptions (/cit/d) for Gen1 devices"""
+
+import threading
+
+from .const import LOGGER
+
+class Cit_cache():
+    """Sensor ids from /cit/d per device type and firmware
+
+    Stored using cb_save_cache, so the description is only fetched once
+    per device type and firmware version.
+    """
+
+    def __init__(self, root):
+        self._root = root
+        self._list = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(device_type, fw_version):
+        return device_type + '|' + (fw_version or '')
+
+    def _load(self):
+        if self._list is None:
+            try:
+                self._list = self._root.load_cache('cit') or {}
+            except Exception as ex:
+                LOGGER.error("Error load cit cache, %s", ex)
+                self._list = {}
+
+    def get(self, key):
+        """Return set of sensor ids or None if not known"""
+        with self._lock:
+            self._load()
+            sensor_ids = self._list.get(key)
+        return set(sensor_ids) if sensor_ids is not None else None
+
+    def put(self, key, cit):
+        """Store the sensor ids of a /cit/d response, return them as set"""
+        sensor_ids = sorted(sen['I'] for sen in cit.get('sen', []))
+        with self._lock:
+            self._load()
+            if self._list.get(key) == sensor_ids:
+                return set(sensor_ids)
+            self._list[key] = sensor_ids
+            data = dict(self._list)
+        self._root.save_cache('cit', data)
+        return set(sensor_ids)
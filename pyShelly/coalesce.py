@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except
+"""Coalesce update callbacks of blocks and devices"""
+
+import threading
+import time
+
+from .utils import exception_log
+
+class Update_coalescer():
+    """Keep at most one pending update per block or device
+
+    An update is sent when the window of the first change since the last
+    update has passed, the values are read by the callbacks then, so the
+    last value is always sent. The window is taken from the policy per
+    changed attribute, a bool state is sent at once if not in the policy.
+    """
+
+    def __init__(self, root):
+        self._root = root
+        self.window = root.update_coalesce_window
+        self.policy = dict(root.update_coalesce_policy or {})
+        self.sent_cnt = 0
+        self.coalesced_cnt = 0
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.name = "S4H-Coalesce"
+        self._thread.daemon = True
+        self._thread.start()
+
+    def get_window(self, name, value):
+        """Window in seconds for a change of attribute name"""
+        window = self.policy.get(name)
+        if window is None:
+            if name == 'state' and isinstance(value, bool):
+                return 0
+            return self.window
+        return window
+
+    def add(self, obj, window):
+        if window is None:
+            window = self.window
+        due = time.time() + window
+        with self._cond:
+            pending = self._pending.get(obj)
+            if pending is not None:
+                self.coalesced_cnt += 1
+                if pending <= due:
+                    return
+            if window > 0:
+                self._pending[obj] = due
+                self._cond.notify()
+                return
+            self._pending.pop(obj, None)
+        self._send(obj)
+
+    def discard(self, obj):
+        with self._cond:
+            self._pending.pop(obj, None)
+
+    def close(self):
+        """Send all pending updates and stop"""
+        with self._cond:
+            pending = list(self._pending)
+            self._pending.clear()
+            self._cond.notify()
+        for obj in pending:
+            self._send(obj)
+
+    def _send(self, obj):
+        self.sent_cnt += 1
+        try:
+            obj._notify_updated()
+        except Exception as ex:
+            exception_log(ex, "Error in update callback")
+
+    def _loop(self):
+        while not self._root.stopped.is_set():
+            with self._cond:
+                now = time.time()
+                due = [obj for obj, at in self._pending.items() if at <= now]
+                for obj in due:
+                    del self._pending[obj]
+                if not due:
+                    wait = min(self._pending.values()) - now \
+                        if self._pending else 1
+                    self._cond.wait(min(wait, 1))
+                    continue
+            for obj in due:
+                self._send(obj)
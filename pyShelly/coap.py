@@ -2,18 +2,25 @@
 # pylint: disable=broad-except, bare-except, invalid-name
 
 import threading
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
+import select
 import socket
-import struct
 
-from .compat import s
+from .compat import s, byte_view, NO_DATA_ERRNOS
 from .utils import exception_log
+from .executor import DeviceExecutor
+from .capture import KIND_COAP
+from .multicast import Multicast_manager
+from . import coap_parser
+from .coap_parser import COAP_CODE_STATUS, COAP_CODE_DISCOVERY
 from .const import (
     LOGGER,
-    COAP_IP,
     COAP_PORT
 )
+
+COAP_BUFFER_SIZE = 4096
+
 class CoAP():
 
     def __init__(self, root):
@@ -22,10 +29,15 @@ class CoAP():
         self._thread.name = "S4H-CoAP"
         self._thread.daemon = True
         self._socket = None
+        self._executor = None
+        self.multicast = Multicast_manager(root)
 
     def start(self):
         try:
             self._init_socket()
+            workers = self._root.coap_workers or 1
+            if workers > 1:
+                self._executor = DeviceExecutor(workers, "CoAP-dispatch")
             self._thread.start()
         except:
             LOGGER.exception("Can't setup CoAP listener")
@@ -33,8 +45,10 @@ class CoAP():
     def discover(self):
         if self._socket:
             LOGGER.debug("Sending CoAP discover UDP")
-            msg = bytes(b'\x50\x01\x00\x0A\xb3cit\x01d\xFF')
-            self._socket.sendto(msg, (COAP_IP, COAP_PORT))
+            self.multicast.discover()
+
+    def discovery_due(self):
+        return self._socket is not None and self.multicast.discovery_due()
 
     def _init_socket(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
@@ -42,156 +56,98 @@ class CoAP():
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         #sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 10)
         sock.bind((self._root.bind_ip, COAP_PORT))
-        if self._root.host_ip:
-            mreq = struct.pack("=4s4s",
-                               socket.inet_aton(COAP_IP),
-                               socket.inet_aton(self._root.host_ip))
-        else:
-            mreq = struct.pack("=4sl",
-                               socket.inet_aton(COAP_IP),
-                               socket.INADDR_ANY)
-        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        sock.settimeout(15)
+        sock.setblocking(False)
+        self.multicast.join(sock)
         self._socket = sock
 
     def close(self):
-        try:
-            self._socket.shutdown(socket.SHUT_RDWR)
-        except socket.error:
-            pass
+        if self._socket:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        if self._executor:
+            self._executor.close()
 
     def _loop(self):
 
         self._root.stopped.wait(10)
         #Just wait some sec to get names from cloud etc
 
-        next_igmp_fix = datetime.now() + timedelta(minutes=1)
+        sock = self._socket
+        buf = bytearray(COAP_BUFFER_SIZE)
+        view = byte_view(buf)
 
         while not self._root.stopped.isSet():
 
             try:
-                # This fix is needed if not sending IGMP reports correct
-                if self._root.igmp_fix_enabled and \
-                        datetime.now() > next_igmp_fix:
-                    LOGGER.debug("IGMP fix")
-                    next_igmp_fix = datetime.now() + timedelta(minutes=1)
-                    if self._root.host_ip:
-                        mreq = struct.pack("=4s4s",
-                               socket.inet_aton(COAP_IP),
-                               socket.inet_aton(self._root.host_ip))
-                    else:
-                        mreq = struct.pack("=4sl",
-                               socket.inet_aton(COAP_IP),
-                               socket.INADDR_ANY)
-
-                    try:
-                        self._socket.setsockopt(socket.IPPROTO_IP,
-                                                socket.IP_DROP_MEMBERSHIP,
-                                                mreq)
-                    except Exception as e:
-                        LOGGER.debug("Can't drop membership, %s", e)
-                    try:
-                        self._socket.setsockopt(socket.IPPROTO_IP,
-                                                socket.IP_ADD_MEMBERSHIP, mreq)
-                    except Exception as e:
-                        LOGGER.debug("Can't add membership, %s", e)
-
-                #todo add auto discover??
+                self.multicast.check()
 
                 #LOGGER.debug("Wait for UDP message")
 
-                try:
-                    data_tmp, addr = self._socket.recvfrom(1024)
-                except socket.timeout:
+                readable, _, _ = select.select([sock], [], [], 15)
+                if not readable:
                     continue
 
-                ipaddr = addr[0]
-
-                #LOGGER.debug("Got UDP message")
-
-                data = bytearray(data_tmp)
-                LOGGER.debug("CoAP msg: %s", ipaddr) #, data_tmp)
-
-                if len(data) < 10:
-                    continue
-
-                pos = 0
-
-                #Receice messages with ip from proxy
-                if data[0] == 112 and data[1] == 114 \
-                   and data[2] == 120 and data[3] == 121:
-                    ipaddr = socket.inet_ntoa(data[4:8])
-                    pos = 8
-
-                byte = data[pos]
-                tkl = byte & 0x0F
-                #ver = byte >> 6
-                #typex = (byte >> 4) & 0x3
-                #tokenlen = byte & 0xF
-
-                code = data[pos+1]
-                #msgid = 256 * data[2] + data[3]
-                LOGGER.debug("CoAP msg: %s %s", code, ipaddr) #, data)
-
-                pos = pos + 4 + tkl
-
-                #LOGGER.debug(' Code: %s', code)
-
-                if code == 30 or code == 69:
-
-                    byte = data[pos]
-                    tot_delta = 0
-
-                    device_type = ''
-                    device_id = ''
-
-                    while byte != 0xFF:
-                        delta = byte >> 4
-                        length = byte & 0x0F
-
-                        if delta == 13:
-                            pos = pos + 1
-                            delta = data[pos] + 13
-                        elif delta == 14:
-                            pos = pos + 2
-                            delta = data[pos - 1] * 256 + data[pos] + 269
-
-                        tot_delta = tot_delta + delta
-
-                        if length == 13:
-                            pos = pos + 1
-                            length = data[pos] + 13
-                        elif length == 14:
-                            pos = pos + 2
-                            length = data[pos - 1] * 256 + data[pos] + 269
-
-                        value = data[pos + 1:pos + length]
-                        pos = pos + length + 1
-
-                        if tot_delta == 3332:
-                            device_type, device_id, _ = s(value).split('#', 2)
-
-                        byte = data[pos]
-
+                #Drain every datagram queued since last wakeup
+                while True:
                     try:
-                        payload = s(data[pos + 1:])
-                    except:
-                        LOGGER.info(data)
-
-                    if payload: #Fix for DW2 payload error
-                        payload = payload.replace(",,",",").replace("][", "],[")
-
-                    LOGGER.debug('CoAP Code: %s, Type %s, Id %s, Payload *%s*', code, device_type, device_id, payload.replace(' ', ''))
-
-                    if code == 30:
-                        self._root.update_block(device_id, device_type,
-                                           ipaddr, 'CoAP-msg', payload)
-
-                    if code == 69:
-                        self._root.update_block(device_id, device_type,
-                                           ipaddr, 'CoAP-discovery', None)
+                        size, addr, unicast = \
+                            self.multicast.recv_into(sock, buf)
+                    except socket.error as ex:
+                        if ex.errno in NO_DATA_ERRNOS:
+                            break
+                        raise
+                    if self._root.recorder:
+                        self._root.recorder.record(KIND_COAP, addr[0],
+                                                   buf[:size])
+                    self._process(view[:size], addr[0], unicast)
 
             except Exception as ex:
                 #LOGGER.debug("Error receive CoAP %s", str(ex))
                 #LOGGER.exception("Error receive CoAP,  " + str(ex))
                 exception_log(ex, "Error receiving CoAP UDP")
+
+    def _process(self, view, ipaddr, unicast=False):
+        """Parse one datagram and pass it on to the root
+
+        unicast is True for a datagram sent to this host by the device,
+        not for frames of a relay forwarding multicast.
+        """
+        if view[0:4] == coap_parser.BATCH_PREFIX:
+            for frame, frame_ip in coap_parser.split_batch(view):
+                self._process(frame, frame_ip)
+            return
+        msg = coap_parser.parse(view, ipaddr)
+        if msg is None:
+            return
+
+        if unicast and view[0:4] != coap_parser.PROXY_PREFIX:
+            block = self._root.blocks.get(msg.device_id.upper())
+            if block:
+                block.last_coap_unicast = datetime.now()
+
+        if msg.code == COAP_CODE_STATUS:
+            payload = s(msg.payload)
+            LOGGER.debug('CoAP Code: %s, Type %s, Id %s, Ip %s, Payload *%s*',
+                         msg.code, msg.device_type, msg.device_id,
+                         msg.ipaddr, payload)
+            self._dispatch(msg.device_id, msg.device_type, msg.ipaddr,
+                           'CoAP-msg', payload)
+
+        elif msg.code == COAP_CODE_DISCOVERY:
+            LOGGER.debug('CoAP Code: %s, Type %s, Id %s, Ip %s',
+                         msg.code, msg.device_type, msg.device_id,
+                         msg.ipaddr)
+            #Payload is the /cit/d device description
+            self._dispatch(msg.device_id, msg.device_type, msg.ipaddr,
+                           'CoAP-discovery', s(msg.payload))
+
+    def _dispatch(self, device_id, device_type, ipaddr, src, payload):
+        """Update block, on the device lane of the executor if workers"""
+        if self._executor:
+            self._executor.submit(device_id, self._root.update_block,
+                                  device_id, device_type, ipaddr, src, payload)
+        else:
+            self._root.update_block(device_id, device_type, ipaddr, src,
+                                    payload)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except, invalid-name
+"""Parser for CoIoT (CoAP) datagrams working on memoryviews
+
+On Python 2.x the view is a bytearray, see compat.byte_view.
+"""
+
+import json
+import socket
+import struct
+from collections import namedtuple
+
+from .compat import s
+
+COAP_CODE_STATUS = 30
+COAP_CODE_DISCOVERY = 69
+
+COAP_OPTION_DEVICE = 3332
+
+#Prefix used by proxies forwarding multicast from other subnets
+PROXY_PREFIX = b'prxy'
+#Several forwarded datagrams, each as 4 byte ip, 2 byte length and data
+BATCH_PREFIX = b'prxb'
+BATCH_HEADER_SIZE = 6
+
+CoapMsg = namedtuple('CoapMsg',
+                     ['code', 'device_type', 'device_id', 'ipaddr', 'payload'])
+
+def parse(view, ipaddr):
+    """Parse one datagram, return CoapMsg or None if not a CoIoT message
+
+    The payload in the result is a memoryview into the receive buffer and
+    is only valid until the buffer is reused for the next datagram.
+    """
+    size = len(view)
+    if size < 10:
+        return None
+
+    pos = 0
+
+    #Receive messages with ip from proxy
+    if view[0:4] == PROXY_PREFIX:
+        ipaddr = socket.inet_ntoa(bytes(view[4:8]))
+        pos = 8
+
+    tkl = view[pos] & 0x0F
+    code = view[pos + 1]
+    if code != COAP_CODE_STATUS and code != COAP_CODE_DISCOVERY:
+        return None
+
+    pos = pos + 4 + tkl
+    device_type = ''
+    device_id = ''
+    tot_delta = 0
+
+    try:
+        byte = view[pos]
+        while byte != 0xFF:
+            delta = byte >> 4
+            length = byte & 0x0F
+
+            if delta == 13:
+                pos += 1
+                delta = view[pos] + 13
+            elif delta == 14:
+                pos += 2
+                delta = view[pos - 1] * 256 + view[pos] + 269
+
+            tot_delta += delta
+
+            if length == 13:
+                pos += 1
+                length = view[pos] + 13
+            elif length == 14:
+                pos += 2
+                length = view[pos - 1] * 256 + view[pos] + 269
+
+            if tot_delta == COAP_OPTION_DEVICE:
+                device_type, device_id, _ = \
+                    s(view[pos + 1:pos + 1 + length]).split('#', 2)
+
+            pos += length + 1
+            byte = view[pos]
+    except (IndexError, ValueError):
+        return None
+
+    return CoapMsg(code, device_type, device_id, ipaddr, view[pos + 1:size])
+
+def split_batch(view):
+    """Yield (datagram, ipaddr) for every datagram in a batch frame"""
+    size = len(view)
+    pos = len(BATCH_PREFIX)
+    while pos + BATCH_HEADER_SIZE <= size:
+        length = view[pos + 4] * 256 + view[pos + 5]
+        start = pos + BATCH_HEADER_SIZE
+        if start + length > size:
+            break
+        ipaddr = socket.inet_ntoa(bytes(view[pos:pos + 4]))
+        yield view[start:start + length], ipaddr
+        pos = start + length
+
+def pack_frame(data, ipaddr):
+    """Return one datagram prepared to be added to a batch frame"""
+    return socket.inet_aton(ipaddr) + struct.pack('>H', len(data)) + data
+
+def decode_status(payload):
+    """Return {position: value} from the str payload of a CoIoT status
+
+    The repair for the broken payloads sent by DW2 is only applied when
+    the strict parse fails.
+    """
+    try:
+        values = json.loads(payload)['G']
+    except ValueError:
+        #Fix for DW2 payload error
+        values = json.loads(payload.replace(",,", ",")
+                            .replace("][", "],["))['G']
+    return {d[1]:d[2] for d in values}
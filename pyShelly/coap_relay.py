@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except, invalid-name
+"""Relay CoIoT multicast from a remote subnet to a central pyShelly host
+
+Joins 224.0.1.187 on the remote VLAN, drops repeated datagrams and
+forwards the rest as unicast batch frames (prxb) to the CoAP listener of
+the central host, that way no multicast routing is needed.
+
+    python -m pyShelly.coap_relay 10.0.0.5 --interface 10.20.0.2
+"""
+
+import argparse
+import logging
+import select
+import socket
+import struct
+import threading
+import time
+
+from . import coap_parser
+from .compat import byte_view, NO_DATA_ERRNOS
+from .const import COAP_IP, COAP_PORT
+
+LOGGER = logging.getLogger('pyShelly.coap_relay')
+
+RELAY_BUFFER_SIZE = 4096
+
+DISCOVERY_MSG = b'\x50\x01\x00\x0A\xb3cit\x01d\xFF'
+
+class CoapRelay():
+    """Forward CoIoT datagrams in batches to a central pyShelly"""
+
+    def __init__(self, target, target_port=COAP_PORT, interface_ip='',
+                 bind_ip='0.0.0.0', batch_delay=0.05, max_size=1400,
+                 dedupe_sec=2.0, discover_interval=60):
+        self.target = (target, target_port)
+        self.interface_ip = interface_ip
+        self.bind_ip = bind_ip
+        self.batch_delay = batch_delay
+        self.max_size = max_size
+        self.dedupe_sec = dedupe_sec
+        self.discover_interval = discover_interval
+        self.stopped = threading.Event()
+        self.received_cnt = 0
+        self.duplicate_cnt = 0
+        self.forwarded_cnt = 0
+        self.sent_cnt = 0
+        self._socket = None
+        self._out = None
+        self._batch = []
+        self._batch_size = 0
+        self._batch_time = None
+        self._seen = {}
+        self._next_prune = 0
+        self._next_discover = 0
+
+    def _init_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                             socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.bind_ip, COAP_PORT))
+        if self.interface_ip:
+            mreq = struct.pack("=4s4s", socket.inet_aton(COAP_IP),
+                               socket.inet_aton(self.interface_ip))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                            socket.inet_aton(self.interface_ip))
+        else:
+            mreq = struct.pack("=4sl", socket.inet_aton(COAP_IP),
+                               socket.INADDR_ANY)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        sock.setblocking(False)
+        self._socket = sock
+        self._out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def close(self):
+        self.stopped.set()
+
+    def run(self):
+        self._init_socket()
+        LOGGER.info("Relay CoAP from %s to %s:%s",
+                    self.interface_ip or 'all interfaces', *self.target)
+        buf = bytearray(RELAY_BUFFER_SIZE)
+        view = byte_view(buf)
+        while not self.stopped.is_set():
+            now = time.time()
+            if self.discover_interval and now >= self._next_discover:
+                self._next_discover = now + self.discover_interval
+                self._discover()
+            timeout = 1.0
+            if self._batch:
+                timeout = max(0, self._batch_time + self.batch_delay - now)
+            readable, _, _ = select.select([self._socket], [], [], timeout)
+            if readable:
+                while True:
+                    try:
+                        size, addr = self._socket.recvfrom_into(buf)
+                    except socket.error as ex:
+                        if ex.errno in NO_DATA_ERRNOS:
+                            break
+                        raise
+                    self._receive(bytes(view[:size]), addr[0])
+            if self._batch and \
+                    time.time() >= self._batch_time + self.batch_delay:
+                self._flush()
+        self._flush()
+        self._socket.close()
+        self._out.close()
+
+    def _discover(self):
+        try:
+            self._socket.sendto(DISCOVERY_MSG, (COAP_IP, COAP_PORT))
+        except socket.error as ex:
+            LOGGER.debug("Can't send CoAP discovery, %s", ex)
+
+    def _receive(self, data, ipaddr):
+        if data == DISCOVERY_MSG or data[0:4] in (coap_parser.PROXY_PREFIX,
+                                                  coap_parser.BATCH_PREFIX):
+            return
+        self.received_cnt += 1
+        now = time.time()
+        key = (ipaddr, data)
+        if self._seen.get(key, 0) > now:
+            self.duplicate_cnt += 1
+            return
+        self._seen[key] = now + self.dedupe_sec
+        if now >= self._next_prune:
+            self._next_prune = now + max(self.dedupe_sec, 1)
+            self._seen = {key: until for key, until in self._seen.items()
+                          if until > now}
+
+        frame = coap_parser.pack_frame(data, ipaddr)
+        if len(coap_parser.BATCH_PREFIX) + len(frame) > self.max_size:
+            #Too big to batch, send alone with the single proxy framing
+            self._send(coap_parser.PROXY_PREFIX +
+                       socket.inet_aton(ipaddr) + data)
+            self.forwarded_cnt += 1
+            return
+        if self._batch_size + len(frame) > self.max_size:
+            self._flush()
+        if not self._batch:
+            self._batch_time = now
+            self._batch_size = len(coap_parser.BATCH_PREFIX)
+        self._batch.append(frame)
+        self._batch_size += len(frame)
+        self.forwarded_cnt += 1
+
+    def _flush(self):
+        if not self._batch:
+            return
+        self._send(coap_parser.BATCH_PREFIX + b''.join(self._batch))
+        self._batch = []
+        self._batch_size = 0
+
+    def _send(self, data):
+        try:
+            self._out.sendto(data, self.target)
+            self.sent_cnt += 1
+        except socket.error as ex:
+            LOGGER.warning("Can't forward CoAP to %s, %s", self.target[0], ex)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m pyShelly.coap_relay",
+        description="Relay Shelly CoIoT multicast to a central pyShelly")
+    parser.add_argument('target',
+                        help="ip or host of pyShelly, optionally host:port")
+    parser.add_argument('--interface', default='',
+                        help="ip of the interface to join multicast on")
+    parser.add_argument('--bind', default='0.0.0.0', help="ip to bind to")
+    parser.add_argument('--batch-delay', type=float, default=50,
+                        help="max ms to hold datagrams for a batch")
+    parser.add_argument('--max-size', type=int, default=1400,
+                        help="max size of forwarded datagrams")
+    parser.add_argument('--dedupe', type=float, default=2.0,
+                        help="drop repeats of a datagram within sec")
+    parser.add_argument('--discover', type=float, default=60,
+                        help="send CoAP discovery every sec, 0 to disable")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    host, _, port = args.target.partition(':')
+    relay = CoapRelay(host, int(port) if port else COAP_PORT,
+                      args.interface, args.bind, args.batch_delay / 1000.0,
+                      args.max_size, args.dedupe, args.discover)
+    try:
+        relay.run()
+    except KeyboardInterrupt:
+        pass
+    LOGGER.info("Received %d, duplicates %d, forwarded %d in %d datagrams",
+                relay.received_cnt, relay.duplicate_cnt,
+                relay.forwarded_cnt, relay.sent_cnt)
+
+if __name__ == '__main__':
+    main()
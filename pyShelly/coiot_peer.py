@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except
+"""Configure Gen1 devices to send CoIoT unicast to this host"""
+
+import threading
+from datetime import datetime, timedelta
+
+from .const import LOGGER, COAP_PORT
+from .executor import DeviceExecutor
+from .loop import Loop
+
+PEER_PENDING = 'pending'
+PEER_UNICAST = 'unicast'
+PEER_MULTICAST = 'multicast'
+
+#Time for a device to restart before unicast from it is counted
+REBOOT_TIME = timedelta(seconds=30)
+
+class Coiot_peer_manager(Loop):
+    """Set coiot_peer of every Gen1 block to host_ip:5683
+
+    The peer is used after a reboot of the device, a failed reboot is
+    retried. A block is verified when CoAP sent to this host, not to the
+    multicast group, arrives after the reboot. Otherwise the peer is
+    cleared and the block is rebooted back to multicast. Telling unicast
+    from multicast needs IP_PKTINFO.
+
+    The state per block is stored using cb_save_cache. A block that fell
+    back is not tried again, a block set to another peer is set again,
+    and without unicast mode the blocks set by us are set back to
+    multicast.
+    """
+
+    def __init__(self, root):
+        super(Coiot_peer_manager, self).__init__("CoIoTPeer", root,
+                                                 timedelta(seconds=30))
+        self._root = root
+        self.peer = None
+        self.verify_time = timedelta(minutes=3)
+        self.state = {}
+        self._peers = {}
+        self._since = {}
+        self._busy = set()
+        self._reboot = set()
+        self._restore_all = False
+        self._restored = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def start(self, enabled=True):
+        """Start unicast mode, or restore multicast of blocks set by us"""
+        self._load()
+        self.peer = None
+        if enabled:
+            coap = self._root._coap
+            if not self._root.host_ip:
+                LOGGER.warning("CoIoT unicast needs host_ip, using multicast")
+            elif not coap or not coap.multicast.pktinfo:
+                LOGGER.warning("CoIoT unicast can't be verified without "
+                               "IP_PKTINFO, using multicast")
+            else:
+                self.peer = "%s:%s" % (self._root.host_ip, COAP_PORT)
+        if self.peer is None and not self._restore_needed():
+            return
+        self._start()
+
+    def restore_multicast(self):
+        """Clear coiot_peer of all Gen1 blocks and reboot them"""
+        self.peer = None
+        self._restore_all = True
+        self._load()
+        self._start()
+
+    def _start(self):
+        if self._executor is None:
+            self._executor = DeviceExecutor(self._root.coiot_unicast_workers,
+                                            "CoIoTPeer")
+            self.start_loop()
+        else:
+            self._last_run = None
+
+    def _load(self):
+        with self._lock:
+            if self.state:
+                return
+            try:
+                data = self._root.load_cache('coiot_peer') or {}
+            except Exception as ex:
+                LOGGER.error("Error load CoIoT peer cache, %s", ex)
+                data = {}
+            now = datetime.now()
+            for block_id, (state, peer) in data.items():
+                self.state[block_id] = state
+                self._peers[block_id] = peer
+                self._since[block_id] = now
+
+    def _save(self):
+        with self._lock:
+            data = {block_id: [state, self._peers.get(block_id)]
+                    for block_id, state in self.state.items()}
+        self._root.save_cache('coiot_peer', data)
+
+    def _restore_needed(self):
+        with self._lock:
+            return any(state in (PEER_PENDING, PEER_UNICAST)
+                       for state in self.state.values())
+
+    def multicast_expected(self):
+        """False when every Gen1 block is set to send CoIoT unicast"""
+        blocks = [block for block in list(self._root.blocks.values())
+                  if not block.rpc]
+        if self.peer is None or not blocks:
+            return True
+        with self._lock:
+            return any(self.state.get(block.id) not in
+                       (PEER_PENDING, PEER_UNICAST) for block in blocks)
+
+    def loop_stopped(self):
+        if self._executor:
+            self._executor.close()
+
+    def loop_timer(self):
+        now = datetime.now()
+        for block in list(self._root.blocks.values()):
+            if block.rpc or block.sleep_device or not block.ip_addr \
+                    or not block.fw_version():
+                continue
+            with self._lock:
+                if block.id in self._busy:
+                    continue
+                state = self.state.get(block.id)
+                if self.peer is None:
+                    if self._restore_all and block.id not in self._restored \
+                            or state in (PEER_PENDING, PEER_UNICAST):
+                        self._submit(block, self._restore)
+                elif state is None or state != PEER_MULTICAST \
+                        and self._peers.get(block.id) != self.peer:
+                    #New block or host_ip changed
+                    self._submit(block, self._set_unicast)
+                elif state == PEER_PENDING:
+                    since = self._since[block.id]
+                    last_unicast = block.last_coap_unicast
+                    if block.id in self._reboot:
+                        self._submit(block, self._reboot_block)
+                    elif last_unicast and last_unicast > since:
+                        self.state[block.id] = PEER_UNICAST
+                        LOGGER.info("CoIoT unicast verified, %s", block.id)
+                        self._submit(block, self._save_state)
+                    elif now - since > self.verify_time:
+                        self._submit(block, self._set_multicast)
+
+    def _submit(self, block, func):
+        self._busy.add(block.id)
+        self._executor.submit(block.id, self._run, func, block)
+
+    def _run(self, func, block):
+        try:
+            func(block)
+        finally:
+            with self._lock:
+                self._busy.discard(block.id)
+
+    def _save_state(self, _block):
+        self._save()
+
+    def _set_unicast(self, block):
+        success, settings = block.http_get("/settings", False)
+        if not success or not isinstance(settings, dict):
+            return
+        coiot = settings.get('coiot')
+        if not coiot:
+            #Firmware without coiot settings
+            self._set_state(block, PEER_MULTICAST)
+            return
+        if coiot.get('peer') != self.peer:
+            success, _ = block.http_get(
+                "/settings?coiot_enable=true&coiot_peer=" + self.peer)
+            if not success:
+                return
+            LOGGER.info("CoIoT peer of %s set to %s", block.id, self.peer)
+            self._set_state(block, PEER_PENDING)
+            with self._lock:
+                self._reboot.add(block.id)
+            self._reboot_block(block)
+        else:
+            self._set_state(block, PEER_PENDING)
+
+    def _reboot_block(self, block):
+        """The peer is used after restart, kept pending until it is done"""
+        success, _ = block.http_get("/reboot")
+        if not success:
+            LOGGER.warning("Can't reboot %s to use CoIoT unicast", block.id)
+            return
+        with self._lock:
+            self._reboot.discard(block.id)
+            self._since[block.id] = datetime.now() + REBOOT_TIME
+
+    def _set_multicast(self, block):
+        LOGGER.warning("No CoIoT unicast from %s, back to multicast",
+                       block.id)
+        success, _ = block.http_get("/settings?coiot_peer=")
+        if not success:
+            return
+        success, _ = block.http_get("/reboot")
+        if success:
+            self._set_state(block, PEER_MULTICAST)
+
+    def _restore(self, block):
+        """Clear the peer and reboot, so multicast is used at once"""
+        success, settings = block.http_get("/settings", False)
+        if not success or not isinstance(settings, dict):
+            return
+        coiot = settings.get('coiot')
+        if coiot and coiot.get('peer'):
+            success, _ = block.http_get("/settings?coiot_peer=")
+            if not success:
+                return
+            block.http_get("/reboot")
+            LOGGER.info("CoIoT peer of %s cleared", block.id)
+        with self._lock:
+            self._restored.add(block.id)
+            self._reboot.discard(block.id)
+            self.state.pop(block.id, None)
+            self._peers.pop(block.id, None)
+        self._save()
+
+    def _set_state(self, block, state):
+        with self._lock:
+            self.state[block.id] = state
+            self._peers[block.id] = self.peer
+            self._since[block.id] = datetime.now()
+        self._save()
@@ -1,15 +1,22 @@
 # -*- coding: utf-8 -*-
 """Python 2.x and 3.x compability fixes"""
 
+import errno
 import sys
 import urllib
 
+#errno of a socket.error when a non blocking socket has no more data
+NO_DATA_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+
 if sys.version_info < (3,):
     import urllib2
 
     def ba2c(x):  # Convert bytearra to compatible string
         return str(x)
 
+    def byte_view(x):  # Indexing a memoryview gives str in 2.x
+        return x if isinstance(x, bytearray) else bytearray(x)
+
     def b(x):
         return bytearray(x)
 
@@ -28,6 +35,9 @@ else:
     def ba2c(x):  # Convert bytearra to compatible bytearray
         return x
 
+    def byte_view(x):  # View indexed as ints without copy
+        return memoryview(x)
+
     def b(x):
         return x
 
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""Deadbands for numeric info values and states"""
+
+import time
+
+def _parse(spec):
+    """Return (absolute, relative) of a number or '<n>%'"""
+    if isinstance(spec, str) and spec.endswith('%'):
+        return 0, float(spec[:-1]) / 100
+    return float(spec), 0
+
+def _numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+class Deadband_filter():
+    """Hold back changes smaller than the deadband of the value
+
+    The change is compared to the last value sent, so a slow drift is
+    sent when it has grown past the deadband. A value held back is sent
+    anyway when max_silence seconds have passed since the last one.
+    """
+
+    def __init__(self, deadbands, max_silence):
+        self._bands = {name: _parse(spec) for name, spec in deadbands.items()}
+        self.max_silence = max_silence
+        self.held_cnt = 0
+
+    def covers(self, name):
+        """True if name has a deadband"""
+        return name in self._bands
+
+    def significant(self, obj, name, value, changed):
+        """True if the value of name should trigger an update"""
+        band = self._bands.get(name)
+        if band is None:
+            return changed
+        sent = obj._sent_values
+        if sent is None:
+            sent = obj._sent_values = {}
+        now = time.time()
+        last = sent.get(name)
+        if last is None:
+            sent[name] = (value, now)
+            return changed
+        last_value, last_time = last
+        if last_value == value:
+            return False
+        if _numeric(value) and _numeric(last_value):
+            diff = abs(value - last_value)
+            if diff <= band[0] or diff <= band[1] * abs(last_value):
+                if self.max_silence is None \
+                        or now - last_time < self.max_silence:
+                    if changed:
+                        self.held_cnt += 1
+                    return False
+        sent[name] = (value, now)
+        return True
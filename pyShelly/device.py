@@ -5,9 +5,16 @@ from .const import LOGGER, SHELLY_TYPES
 from .base import Base
 
 class Device(Base):
+    __slots__ = ('block', 'id', 'unit_id', 'type', 'is_device', 'is_sensor',
+                 'sub_name', 'state_values', 'device_type', 'device_sub_type',
+                 'device_nr', 'master_unit', 'head_unit', 'ext_sensor',
+                 'major_unit', 'discovery_src')
+
     def __init__(self, block):
         super(Device, self).__init__()
         self.block = block
+        self._coalescer = block._coalescer
+        self._deadband = block._deadband
         self.id = block.id
         self.unit_id = block.id
         self.type = block.type
@@ -79,7 +86,7 @@ class Device(Base):
         if not res and topic and self.block.mqtt_available:
             res = self.block.parent.send_mqtt(self.block, topic, payload, rpc_method, rpc_params)
         if not res and self.ip_addr and url:
-            res, _ = self.block.http_get(url)
+            res = self.block.send_http(url)
         self.block.update_status_interval = None #Force update
 
     def available(self):
@@ -96,6 +103,8 @@ class Device(Base):
             if self.state_values != new_state_values:
                 self.state_values = new_state_values
                 self.need_update = True
+                if self._coalescer is not None or self.cb_changed:
+                    self._changed('state_values', new_state_values, src)
         if self.lazy_load:
             self.block.parent.callback_add_device(self)
         self.raise_updated()
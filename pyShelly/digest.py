@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""SHA-256 digest authentication of Gen2 devices"""
+
+import hashlib
+import random
+import threading
+
+#Gen2 devices only have this user
+GEN2_USERNAME = 'admin'
+
+def _sha256(*parts):
+    return hashlib.sha256(':'.join(str(part) for part in parts)
+                          .encode()).hexdigest()
+
+def parse_challenge(header):
+    """Return the values of a WWW-Authenticate: Digest header"""
+    values = {}
+    for part in header.split(' ', 1)[-1].split(','):
+        name, _, value = part.strip().partition('=')
+        if name:
+            values[name.lower()] = value.strip('"')
+    return values
+
+class Digest_auth():
+    """Realm and nonce of one device, used until a request is rejected"""
+
+    def __init__(self, password, username=GEN2_USERNAME):
+        self.username = username
+        self.password = password
+        self.realm = None
+        self.nonce = None
+        self._nc = 0
+        self._ha1 = None
+        self._lock = threading.Lock()
+
+    def set_challenge(self, challenge):
+        """Take realm and nonce from a 401, header values or RPC error"""
+        realm = challenge.get('realm')
+        with self._lock:
+            if realm != self.realm or self._ha1 is None:
+                self._ha1 = _sha256(self.username, realm, self.password)
+            self.realm = realm
+            self.nonce = challenge.get('nonce')
+            self._nc = 0
+
+    def http_header(self, method, uri, cnonce=None):
+        """Authorization header for a HTTP request"""
+        with self._lock:
+            self._nc += 1
+            ncount = '%08x' % self._nc
+            realm = self.realm
+            nonce = self.nonce
+            ha1 = self._ha1
+        if cnonce is None:
+            cnonce = '%016x' % random.getrandbits(64)
+        response = _sha256(ha1, nonce, ncount, cnonce, 'auth',
+                           _sha256(method, uri))
+        return ('Digest username="%s", realm="%s", nonce="%s", uri="%s", '
+                'algorithm=SHA-256, response="%s", qop=auth, nc=%s, '
+                'cnonce="%s"' % (self.username, realm, nonce, uri,
+                                 response, ncount, cnonce))
+
+    def rpc_auth(self, cnonce=None):
+        """auth object of a RPC frame, the device counts it as nc 1"""
+        with self._lock:
+            realm = self.realm
+            nonce = self.nonce
+            ha1 = self._ha1
+        if cnonce is None:
+            cnonce = random.getrandbits(32)
+        response = _sha256(ha1, nonce, 1, cnonce, 'auth',
+                           _sha256('dummy_method', 'dummy_uri'))
+        return {'realm': realm, 'username': self.username,
+                'nonce': nonce, 'cnonce': cnonce, 'response': response,
+                'algorithm': 'SHA-256'}
@@ -17,6 +17,8 @@ from .const import (
 )
 
 class Dimmer(Device):
+    __slots__ = ('url', 'brightness', 'state_pos', 'dim_pos')
+
     def __init__(self, block, state_pos, dim_pos):
         super(Dimmer, self).__init__(block)
         self.id = block.id
@@ -26,9 +28,14 @@ class Dimmer(Device):
         self.brightness = None
         self.state_pos = state_pos
         self.dim_pos = dim_pos
-        self.info_values = {}
         self.is_sensor = True
 
+    def coap_positions(self):
+        return self._coap_pos(self.state_pos) + \
+            self._coap_pos(self.dim_pos) + \
+            self._coap_pos([131, 2101], 0) + \
+            self._coap_pos([131, 2101], 1) + self._coap_pos([4101])
+
     def update_coap(self, payload):
         new_state = self.coap_get(payload, self.state_pos) == 1
         self.brightness = self.coap_get(payload, self.dim_pos)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except
+"""Async stream of block and device events"""
+
+import asyncio
+from collections import deque
+import threading
+
+from .utils import exception_log
+
+EVENT_BLOCK_ADDED = 'block_added'
+EVENT_DEVICE_ADDED = 'device_added'
+EVENT_DEVICE_REMOVED = 'device_removed'
+EVENT_UPDATED = 'updated'
+
+#Overflow policies when the queue is full
+OVERFLOW_LATEST = 'latest'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+
+class Event():
+    """Event of a block or device, changes is {name: src} for updates"""
+    __slots__ = ('kind', 'obj', 'changes')
+
+    def __init__(self, kind, obj, changes=None):
+        self.kind = kind
+        self.obj = obj
+        self.changes = changes
+
+    def __repr__(self):
+        return "Event(%s, %s, %s)" % (self.kind, self.obj.id, self.changes)
+
+class Event_stream():
+    """Async iterator of events put by the receive and poll threads
+
+    Events are queued under a lock and the loop is woken with one
+    call_soon_threadsafe per batch, the iterator then takes all queued
+    events at once. When the queue is full the policy decides for update
+    events, latest merges the update into the queued update of the same
+    block or device, the values are read when the event is handled so
+    the latest values are kept. If there is none the oldest update that
+    has a newer update of its block or device queued is merged into
+    that one, otherwise the oldest update is dropped. maxsize only bounds
+    the update events, added and removed events are never dropped.
+    """
+
+    def __init__(self, root, loop, maxsize, policy):
+        self._root = root
+        self._loop = loop
+        self.maxsize = max(maxsize, 1)
+        self.policy = policy
+        self.max_depth = 0
+        self.event_cnt = 0
+        self.batch_cnt = 0
+        self.merged_cnt = 0
+        self.dropped_cnt = 0
+        self._queue = deque()
+        self._last_update = {}
+        self._update_cnt = 0
+        self._batch = deque()
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+        self._signalled = False
+        self._closed = False
+
+    @property
+    def depth(self):
+        """Number of events not yet taken by the iterator"""
+        return len(self._queue) + len(self._batch)
+
+    def block_added(self, block):
+        self._watch(block)
+        self.put(Event(EVENT_BLOCK_ADDED, block))
+
+    def device_added(self, dev, visible=True):
+        """Watch dev, the event is put when it is visible, not lazy load"""
+        self._watch(dev)
+        if visible:
+            self.put(Event(EVENT_DEVICE_ADDED, dev))
+
+    def device_removed(self, dev):
+        self._unwatch(dev)
+        self.put(Event(EVENT_DEVICE_REMOVED, dev))
+
+    def _watch(self, obj):
+        if self._changed not in obj.cb_changed:
+            obj.cb_changed.append(self._changed)
+
+    def _unwatch(self, obj):
+        if self._changed in obj.cb_changed:
+            obj.cb_changed.remove(self._changed)
+
+    def _changed(self, obj, changes):
+        self.put(Event(EVENT_UPDATED, obj, dict(changes)))
+
+    def put(self, event):
+        with self._lock:
+            if self._closed:
+                return
+            self.event_cnt += 1
+            queue = self._queue
+            if event.kind == EVENT_UPDATED \
+                    and self._update_cnt >= self.maxsize:
+                if self.policy == OVERFLOW_DROP_NEWEST:
+                    self.dropped_cnt += 1
+                    return
+                if self.policy == OVERFLOW_LATEST:
+                    last = self._last_update.get(event.obj)
+                    if last is not None:
+                        last.changes.update(event.changes)
+                        self.merged_cnt += 1
+                        return
+                    if not self._merge_oldest_update():
+                        self._drop_oldest_update()
+                else:
+                    self._drop_oldest_update()
+            queue.append(event)
+            if event.kind == EVENT_UPDATED:
+                self._last_update[event.obj] = event
+                self._update_cnt += 1
+            if len(queue) > self.max_depth:
+                self.max_depth = len(queue)
+            if self._signalled:
+                return
+            self._signalled = True
+        self._wakeup()
+
+    def _merge_oldest_update(self):
+        """Merge the oldest update with a newer one queued, False if none"""
+        for event in self._queue:
+            if event.kind == EVENT_UPDATED:
+                last = self._last_update[event.obj]
+                if last is not event:
+                    break
+        else:
+            return False
+        self._queue.remove(event)
+        for name, src in event.changes.items():
+            last.changes.setdefault(name, src)
+        self._update_cnt -= 1
+        self.merged_cnt += 1
+        return True
+
+    def _drop_oldest_update(self):
+        for event in self._queue:
+            if event.kind == EVENT_UPDATED:
+                break
+        self._queue.remove(event)
+        if self._last_update.get(event.obj) is event:
+            del self._last_update[event.obj]
+        self._update_cnt -= 1
+        self.dropped_cnt += 1
+
+    def _wakeup(self):
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            #Loop closed
+            pass
+        except Exception as ex:
+            exception_log(ex, "Error waking event stream")
+
+    def _take(self):
+        """Move all queued events to the batch, False if none"""
+        with self._lock:
+            if not self._queue:
+                self._signalled = False
+                self._ready.clear()
+                return False
+            self._batch, self._queue = self._queue, self._batch
+            self._last_update.clear()
+            self._update_cnt = 0
+            self.batch_cnt += 1
+            return True
+
+    def close(self):
+        """Stop the stream, the iterator ends when the queue is empty"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for obj in list(self._root.blocks.values()) + self._root.devices:
+            self._unwatch(obj)
+        if self in self._root._event_streams:
+            self._root._event_streams.remove(self)
+        self._wakeup()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._batch:
+            if self._take():
+                break
+            if self._closed:
+                raise StopAsyncIteration
+            await self._ready.wait()
+        return self._batch.popleft()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except
+"""Executors running work for devices on a fixed number of threads"""
+
+import heapq
+import threading
+import time
+try:
+    import queue
+except:
+    import Queue as queue
+
+from .utils import exception_log
+
+class DeviceExecutor():
+    """Fixed number of lanes, work is routed to a lane by device key
+
+    All work submitted with the same key is run by the same thread, so
+    updates for one block are always applied in the order received.
+    """
+
+    def __init__(self, workers, name):
+        self._queues = []
+        self._threads = []
+        for idx in range(workers):
+            work_queue = queue.Queue()
+            thread = threading.Thread(target=self._loop, args=(work_queue,))
+            thread.name = "S4H-%s-%d" % (name, idx)
+            thread.daemon = True
+            self._queues.append(work_queue)
+            self._threads.append(thread)
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, func, *args):
+        self._queues[hash(key) % len(self._queues)].put((func, args))
+
+    def queue_size(self):
+        return sum(work_queue.qsize() for work_queue in self._queues)
+
+    def close(self):
+        for work_queue in self._queues:
+            work_queue.put(None)
+
+    @staticmethod
+    def _loop(work_queue):
+        while True:
+            work = work_queue.get()
+            if work is None:
+                break
+            func, args = work
+            try:
+                func(*args)
+            except Exception as ex:
+                exception_log(ex, "Error in device executor")
+
+#Priority of work for PriorityExecutor, lower runs first
+PRIORITY_COMMAND = 0
+PRIORITY_POLL = 1
+
+class PriorityExecutor():
+    """Fixed number of workers, one work at a time per device key
+
+    Work is taken by priority and then in order, so commands overtake
+    queued polls. Work for a key that is running waits, a slow device
+    holds at most one worker. Work with a unique id is not queued again
+    while it is waiting.
+    """
+
+    def __init__(self, workers, name):
+        self._heap = []
+        self._seq = 0
+        self._running = set()
+        self._unique = set()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.run_cnt = 0
+        self.skipped_cnt = 0
+        self.wait_total = 0.0
+        self.max_wait = 0.0
+        self._threads = []
+        for idx in range(workers):
+            thread = threading.Thread(target=self._loop)
+            thread.name = "S4H-%s-%d" % (name, idx)
+            thread.daemon = True
+            self._threads.append(thread)
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, priority, func, *args, **kwargs):
+        """Queue func(*args), unique=id skips it if id is waiting"""
+        unique = kwargs.get('unique')
+        with self._cond:
+            if unique is not None:
+                if unique in self._unique:
+                    self.skipped_cnt += 1
+                    return False
+                self._unique.add(unique)
+            self._seq += 1
+            heapq.heappush(self._heap, (priority, self._seq, key, unique,
+                                        time.time(), func, args))
+            self._cond.notify()
+        return True
+
+    def queue_size(self):
+        return len(self._heap)
+
+    def avg_wait(self):
+        """Average seconds from submit to start"""
+        return self.wait_total / self.run_cnt if self.run_cnt else 0.0
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _next(self):
+        """Pop the first work with a key not running, None if none"""
+        busy = []
+        work = None
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            if item[2] in self._running:
+                busy.append(item)
+                continue
+            work = item
+            break
+        for item in busy:
+            heapq.heappush(self._heap, item)
+        return work
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                work = None
+                while not self._stopped:
+                    work = self._next()
+                    if work is not None:
+                        break
+                    self._cond.wait()
+                if work is None:
+                    break
+                _, _, key, unique, queued, func, args = work
+                self._running.add(key)
+                self._unique.discard(unique)
+                wait = time.time() - queued
+                self.run_cnt += 1
+                self.wait_total += wait
+                if wait > self.max_wait:
+                    self.max_wait = wait
+            try:
+                func(*args)
+            except Exception as ex:
+                exception_log(ex, "Error in priority executor")
+            finally:
+                with self._cond:
+                    self._running.discard(key)
+                    self._cond.notify_all()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Info value cfgs compiled into extractors, one per cfg and channel
+
+Positions, paths and topics are resolved for the channel when compiled
+and the format pipeline is built once per source, so a message only
+does lookups. Identical cfgs on the same channel share one extractor.
+"""
+
+import copy
+import inspect
+import json
+
+from .firmware import format_version
+from .const import (
+    ATTR_PATH,
+    ATTR_FMT,
+    ATTR_POS,
+    ATTR_CHANNEL,
+    ATTR_TOPIC,
+    ATTR_RPC,
+    SRC_COAP,
+    SRC_MQTT
+)
+
+_CACHE = {}
+
+def _as_list(value):
+    if value is None:
+        return []
+    if not type(value) is list:
+        return [value]
+    return value
+
+def expand_coap_pos(pos_list, channel):
+    """Return the CoAP positions of pos_list with channel applied"""
+    return tuple(pos + 10 * channel if pos < 1000 else pos + 100 * channel
+                 for pos in _as_list(pos_list))
+
+def _to_bool(value):
+    if value == 'on':
+        return True
+    if value == 'off':
+        return False
+    return int(value) > 0
+
+def _round(digits):
+    return lambda value: round(value, digits)
+
+def _divide(div):
+    return lambda value: value / div
+
+def _fmt_step(fmt):
+    if callable(fmt):
+        return fmt
+    params = fmt.split(':')
+    cmd = params[0]
+    if cmd == 'bool':
+        return _to_bool
+    if cmd == 'round':
+        return _round(int(params[1])) if len(params) > 1 else round
+    if cmd == 'float':
+        return float
+    if cmd[0] == '/':
+        return _divide(int(fmt[1:]))
+    if cmd == 'ver':
+        return format_version
+    return None
+
+def _compile_fmt(fmt, src):
+    if type(fmt) is dict:
+        fmt = fmt.get(src)
+    steps = [_fmt_step(step) for step in _as_list(fmt) if step is not None]
+    return tuple(step for step in steps if step is not None)
+
+class Extractor():
+    """Get the value of one cfg entry from CoAP, status, MQTT or RPC"""
+
+    def __init__(self, cfg, channel):
+        channel = cfg.get(ATTR_CHANNEL, channel)
+        self.channel = channel
+        self.coap_pos = expand_coap_pos(cfg.get(ATTR_POS), channel)
+        path = cfg.get(ATTR_PATH)
+        self.path = tuple(channel if key == '$' else key
+                          for key in path.split('/')) if path else None
+        topics = _as_list(cfg.get(ATTR_TOPIC))
+        self.status_key = next((topic[1:] for topic in topics
+                                if topic[0] == '@'), None)
+        self.topics = frozenset(topic.replace('$', str(channel))
+                                for topic in topics)
+        self.rpc_paths = tuple(
+            tuple((key[8:], True) if key.startswith('include:')
+                  else (key, False)
+                  for key in rpc.replace('$', str(channel)).split('/'))
+            for rpc in _as_list(cfg.get(ATTR_RPC)))
+        self.rpc_keys = tuple(tuple(key for key, _ in path)
+                              for path in self.rpc_paths)
+        self._rpc_prefixes = frozenset(keys[:size] for keys in self.rpc_keys
+                                       for size in range(1, len(keys) + 1))
+        self._fmt = cfg.get(ATTR_FMT)
+        self._pipelines = {}
+        self._resolved = {}
+        self._origin = self
+
+    def fmt(self, value, src):
+        pipeline = self._pipelines.get(src)
+        if pipeline is None:
+            pipeline = self._pipelines[src] = _compile_fmt(self._fmt, src)
+        for step in pipeline:
+            value = step(value)
+        return value
+
+    def get_coap(self, payload):
+        for pos in self.coap_pos:
+            if pos in payload:
+                return self.fmt(payload[pos], SRC_COAP)
+        return None
+
+    def get_status(self, status, src):
+        if not self.path:
+            return None
+        value = status
+        for key in self.path:
+            if value is not None:
+                if isinstance(key, int):
+                    value = value[key]
+                else:
+                    value = value.get(key, None)
+        if value is None:
+            return None
+        return self.fmt(value, src)
+
+    def get_mqtt(self, payload):
+        topic = payload['topic']
+        if topic == 'status':
+            if self.status_key is None:
+                return None
+            if not 'json_data' in payload:
+                payload['json_data'] = json.loads(payload['data'])
+            return self.fmt(payload['json_data'][self.status_key], SRC_MQTT)
+        if topic in self.topics:
+            return self.fmt(payload['data'], SRC_MQTT)
+        return None
+
+    def get_rpc(self, rpc_data):
+        for path in self.rpc_paths:
+            value = rpc_data
+            for key, include in path:
+                if value is not None:
+                    if include:
+                        value = key in value
+                    else:
+                        value = value.get(key, None)
+            if value is not None:
+                return self.fmt(value, SRC_MQTT)
+        return None
+
+    def reads_rpc(self, changed):
+        """True if a RPC path is inside or above a changed path
+
+        changed is (paths, paths and all their prefixes) for one top
+        level key, as returned by Status_tree.update.
+        """
+        paths, prefixes = changed
+        for keys in self.rpc_keys:
+            if keys in prefixes:
+                return True
+        return not self._rpc_prefixes.isdisjoint(paths)
+
+    def resolve_coap(self, sensor_ids):
+        """Return extractor only using the CoAP position in sensor_ids
+
+        All positions are kept if none of them is in sensor_ids.
+        """
+        origin = self._origin
+        pos = next((pos for pos in origin.coap_pos if pos in sensor_ids),
+                   None)
+        if pos is None:
+            return origin
+        resolved = origin._resolved.get(pos)
+        if resolved is None:
+            resolved = copy.copy(origin)
+            resolved.coap_pos = (pos,)
+            origin._resolved[pos] = resolved
+        return resolved
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item))
+                            for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if inspect.ismethod(value):
+        #Bound to a device, don't keep it alive in the cache
+        raise TypeError("Bound method in cfg")
+    hash(value)
+    return value
+
+def compile_cfg(cfg, channel):
+    """Return shared Extractor for cfg on channel"""
+    try:
+        key = (channel, _freeze(cfg))
+    except TypeError:
+        return Extractor(cfg, channel)
+    extractor = _CACHE.get(key)
+    if extractor is None:
+        extractor = _CACHE.setdefault(key, Extractor(cfg, channel))
+    return extractor
+
+def compile_cfgs(cfgs, channel):
+    """Return [(name, Extractor)] for a dict of cfgs"""
+    if not cfgs:
+        return []
+    return [(name, compile_cfg(cfg, channel)) for name, cfg in cfgs.items()]
@@ -10,6 +10,12 @@ from .const import (
 )
 from .loop import Loop
 
+def format_version(value):
+    ver = re.search(REGEX_VER, value)
+    if ver:
+        return ver.group(2) # + " (" + ver.group(1) + ")"
+    return value
+
 class Firmware_manager(Loop):
 
     def __init__(self, parent):
@@ -38,10 +44,7 @@ class Firmware_manager(Loop):
         return {}
 
     def format(self, value):
-        ver = re.search(REGEX_VER, value)
-        if ver:
-            return ver.group(2) # + " (" + ver.group(1) + ")"
-        return value
+        return format_version(value)
 
     def version(self, shelly_type, beta):
         if shelly_type in self.list:
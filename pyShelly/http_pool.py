@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except
+"""Persistent HTTP connections per host"""
+
+import socket
+import threading
+import time
+try:
+    import http.client as httplib
+except:
+    import httplib
+
+from .digest import Digest_auth
+
+#Idle connections kept per host
+MAX_IDLE = 2
+#Seconds an idle connection is kept, devices close them after a while
+IDLE_TIMEOUT = 20
+
+class Http_pool():
+    """Idle keep-alive connections per host and the auth of the hosts"""
+
+    def __init__(self, timeout=5):
+        self.timeout = timeout
+        self.auth_hosts = set()
+        self.digests = {}
+        self.created_cnt = 0
+        self.reused_cnt = 0
+        self._idle = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        """Return (connection, reused)"""
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(host)
+            while idle:
+                conn, since = idle.pop()
+                if now - since < IDLE_TIMEOUT:
+                    self.reused_cnt += 1
+                    return conn, True
+                conn.close()
+            self.created_cnt += 1
+        return httplib.HTTPConnection(host, timeout=self.timeout), False
+
+    def put(self, host, conn):
+        """Keep conn for the next request to host"""
+        with self._lock:
+            idle = self._idle.setdefault(host, [])
+            if len(idle) < MAX_IDLE:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def digest(self, host, password):
+        """Digest_auth of host, a new one if the password changed"""
+        with self._lock:
+            digest = self.digests.get(host)
+            if digest is None or digest.password != password:
+                digest = self.digests[host] = Digest_auth(password)
+            return digest
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def host_name(self, host):
+        """Cached reverse DNS name of host, looked up in the background"""
+        with self._lock:
+            if host in self._names:
+                return self._names[host]
+            self._names[host] = None
+        thread = threading.Thread(target=self._resolve, args=(host,))
+        thread.name = "S4H-Resolve"
+        thread.daemon = True
+        thread.start()
+        return None
+
+    def _resolve(self, host):
+        try:
+            name = socket.gethostbyaddr(host.partition(':')[0])[0]
+        except Exception:
+            name = ''
+        with self._lock:
+            self._names[host] = name
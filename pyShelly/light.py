@@ -25,10 +25,16 @@ from .const import (
 )
 
 class Light(Device):
+    __slots__ = ()
+
     def __init__(self, block):
         super(Light, self).__init__(block)
 
 class LightWhite(Light):
+    __slots__ = ('url', 'brightness', 'color_temp', 'state_pos', 'bright_pos',
+                 'temp_pos', 'support_color_temp', '_color_temp_min',
+                 '_color_temp_max')
+
     def __init__(self, block, channel, state_pos, bright_pos, 
                  temp_pos=None, power_pos=None):
         super(LightWhite, self).__init__(block)
@@ -48,7 +54,6 @@ class LightWhite(Light):
         self.state_pos = state_pos
         self.bright_pos = bright_pos
         self.temp_pos = temp_pos
-        self.info_values = {}
 
         self.support_color_temp = False
         self._color_temp_min = None
@@ -83,6 +88,13 @@ class LightWhite(Light):
             values = {'brightness': self.brightness, "color_temp": self.color_temp}
             self._update(SRC_MQTT, new_state, values)
 
+    def mqtt_topics(self):
+        return ("white/" + str(self._channel) + '/status',)
+
+    def coap_positions(self):
+        return self._coap_pos(self.state_pos) + \
+            self._coap_pos(self.bright_pos) + self._coap_pos(self.temp_pos)
+
     def update_coap(self, payload):
         new_state = self.coap_get(payload, self.state_pos) == 1
         bright = self.coap_get(payload, self.bright_pos)
@@ -156,6 +168,11 @@ class LightWhite(Light):
         self._send_data(True, color_temp=value)
 
 class LightRGB(Light):
+    __slots__ = ('url', 'mode', 'brightness', 'white_value', 'rgb',
+                 'color_temp', 'effect', 'effects_list', 'allow_switch_mode',
+                 'support_color_temp', 'support_white_value', 'state_pos',
+                 'power_pos', 'topic')
+
     def __init__(self, block, state_pos, channel=0, power_pos=None):
         super(LightRGB, self).__init__(block)
         self.id = block.id
@@ -182,7 +199,6 @@ class LightRGB(Light):
             self._channel = channel-1
         else:
             self._channel = 0
-        self.info_values = {}
         self._info_value_cfg = {
             # INFO_VALUE_SWITCH : {
             #     ATTR_POS: [118, 2101],
@@ -203,6 +219,9 @@ class LightRGB(Light):
 
         self.topic = "color/0"
 
+    def mqtt_topics(self):
+        return ("color/" + str(self._channel) + '/status',)
+
     def update_mqtt(self, payload):
         if payload['topic'] == "color/" + str(self._channel) + '/status':
             status =  json.loads(payload['data'])
@@ -392,17 +411,23 @@ class LightRGB(Light):
         self._send_data(True, white_value=value)
 
 class Bulb(LightRGB):
+    __slots__ = ()
+
     def __init__(self, block):
         super(Bulb, self).__init__(block, [1101, 181])
         self.effects_list = EFFECTS_BULB
         self.support_color_temp = True
 
 class RGBWW(LightRGB):
+    __slots__ = ()
+
     def __init__(self, block):
         super(RGBWW, self).__init__(block, 151)
         self.support_color_temp = True
 
 class RGBW2W(LightWhite):
+    __slots__ = ('mode', 'topic', 'effects_list', 'allow_switch_mode')
+
     def __init__(self, block, channel):
         super(RGBW2W, self).__init__(block, channel, [161, 1101], [111, 5101],
                                      power_pos=[201, 4101])
@@ -429,6 +454,8 @@ class RGBW2W(LightWhite):
     #         self._reload_block()
 
 class RGBW2C(LightRGB):
+    __slots__ = ()
+
     def __init__(self, block):
         super(RGBW2C, self).__init__(block, [161, 1101], 0, [211, 4101])
         self.mode = "color"
@@ -439,6 +466,8 @@ class RGBW2C(LightRGB):
         self.support_white_value = True
 
 class Duo(LightWhite):
+    __slots__ = ()
+
     def __init__(self, block):
         super(Duo, self).__init__(block, 0, [121, 1101], [111, 5101], [131, 5103])
         self.support_color_temp = True
@@ -447,6 +476,8 @@ class Duo(LightWhite):
         self.is_sensor = True
 
 class Vintage(LightWhite):
+    __slots__ = ()
+
     def __init__(self, block):
         super(Vintage, self).__init__(block, 0, [121, 1101], [111, 5101])
         self.is_sensor = True
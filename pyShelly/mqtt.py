@@ -1,5 +1,6 @@
 import json
 from .compat import s
+from .capture import KIND_MQTT
 
 from .const import (
     LOGGER, SHELLY_TYPES
@@ -15,7 +16,9 @@ class MQTT(object):
             if 'mqtt' in item:
                 self._mqtt_types[item['mqtt']]=key
 
-    def receive_msg(self, topic, data):
+    def receive_msg(self, topic, data, ipaddr=None):
+        if self._root.recorder:
+            self._root.recorder.record(KIND_MQTT, ipaddr, data, topic, self.src)
         try:
             if topic.startswith("shelly4hass/"):
                 json_data = json.loads(data)
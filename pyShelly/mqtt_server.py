@@ -63,7 +63,8 @@ class MQTT_connection:
                         if qos>0: 
                             pos+=2
                         payload = data[pos:].decode('ASCII')
-                        self._mqtt_server.receive_msg(topic, payload)
+                        self._mqtt_server.receive_msg(topic, payload,
+                                                      self._client_address[0])
                         # if topic=='shellies/announce':
                         #     payload = json.loads(payload)
                         #     ip_addr = payload['ip']
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=broad-except, bare-except
+"""Multicast membership and CoAP discovery for the CoAP listener"""
+
+import socket
+import struct
+import time
+
+from .const import (
+    LOGGER,
+    COAP_IP,
+    COAP_PORT
+)
+
+#Get local and destination address of received datagrams, None if the
+#platform has no such option
+IP_PKTINFO = getattr(socket, 'IP_PKTINFO', None)
+PKTINFO = struct.Struct('=i4s4s')
+COAP_GROUP = socket.inet_aton(COAP_IP)
+
+DISCOVERY_MSG = b'\x50\x01\x00\x0A\xb3cit\x01d\xFF'
+
+#Gen1 devices report every 15 sec, silence is counted from this or from
+#SILENCE_FACTOR times the normal gap between datagrams if longer
+SILENCE_MIN = 45
+SILENCE_FACTOR = 10
+REJOIN_MAX = 600
+DISCOVERY_MIN = 10
+DISCOVERY_MAX = 600
+
+class Interface():
+    """Membership of one local interface, ip '' is any interface"""
+
+    def __init__(self, ip):
+        self.ip = ip
+        self.joined = time.time()
+        self.last_received = None
+        self.gap = None
+        self.received_cnt = 0
+        self.rejoin_cnt = 0
+        self.rejoin_delay = SILENCE_MIN
+        self.next_rejoin = 0
+
+    def mreq(self):
+        if self.ip:
+            return struct.pack("=4s4s", COAP_GROUP, socket.inet_aton(self.ip))
+        return struct.pack("=4sl", COAP_GROUP, socket.INADDR_ANY)
+
+    def received(self, now):
+        if self.last_received is not None:
+            gap = now - self.last_received
+            #Moving average of time between multicast datagrams
+            self.gap = gap if self.gap is None else self.gap + \
+                0.1 * (gap - self.gap)
+        elif self.rejoin_cnt:
+            LOGGER.info("CoAP multicast back on %s", self.ip or 'any')
+        self.last_received = now
+        self.received_cnt += 1
+
+    def silence_limit(self):
+        if self.gap is None:
+            return SILENCE_MIN
+        return max(SILENCE_MIN, SILENCE_FACTOR * self.gap)
+
+class Multicast_manager():
+    """Join CoAP multicast on all interfaces and watch that it arrives
+
+    An interface without multicast for longer than expected is joined
+    again (when igmp_fix_enabled) and discovery is sent often until the
+    devices answer, then the discovery interval is backed off. No
+    multicast is expected when all Gen1 devices send CoIoT unicast.
+    """
+
+    def __init__(self, root):
+        self._root = root
+        self._socket = None
+        self.interfaces = []
+        self._by_ip = {}
+        self._default = None
+        self.pktinfo = False
+        self._next_check = 0
+        self._discovery_interval = DISCOVERY_MIN
+        self._next_discovery = 0
+
+    def join(self, sock):
+        self._socket = sock
+        ips = self._root.multicast_interfaces or [self._root.host_ip]
+        for ip in ips:
+            if ip in self._by_ip:
+                continue
+            iface = Interface(ip)
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                iface.mreq())
+            except socket.error as ex:
+                LOGGER.warning("Can't join CoAP multicast on %s, %s",
+                               ip or 'any', ex)
+            self.interfaces.append(iface)
+            self._by_ip[ip] = iface
+        self._default = self._by_ip.get('')
+        if self._default is None and len(self.interfaces) == 1:
+            self._default = self.interfaces[0]
+        self.pktinfo = False
+        if IP_PKTINFO is not None and hasattr(sock, 'recvmsg_into'):
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, IP_PKTINFO, 1)
+                self.pktinfo = True
+            except:
+                pass
+        self.fast_discovery()
+
+    def recv_into(self, sock, buf):
+        """Receive one datagram, return (size, addr, unicast)
+
+        unicast is None when the destination is not known.
+        """
+        if not self.pktinfo:
+            size, addr = sock.recvfrom_into(buf)
+            #Unicast can't be told from multicast here
+            if self._default:
+                self._default.received(time.time())
+            return size, addr, None
+        size, ancdata, _, addr = sock.recvmsg_into([buf], 64)
+        unicast = None
+        for level, kind, data in ancdata:
+            if level == socket.IPPROTO_IP and kind == IP_PKTINFO:
+                _, local, dst = PKTINFO.unpack(data[:PKTINFO.size])
+                unicast = dst != COAP_GROUP
+                if not unicast:
+                    iface = self._by_ip.get(socket.inet_ntoa(local),
+                                            self._default)
+                    if iface:
+                        iface.received(time.time())
+        return size, addr, unicast
+
+    def check(self):
+        """Rejoin interfaces that have gone silent"""
+        now = time.time()
+        if now < self._next_check:
+            return
+        self._next_check = now + 5
+        if not self._root._coiot_peer.multicast_expected():
+            return
+        for iface in self.interfaces:
+            since = iface.last_received or iface.joined
+            if now - since < iface.silence_limit():
+                iface.rejoin_delay = SILENCE_MIN
+                continue
+            if now < iface.next_rejoin:
+                continue
+            LOGGER.info("No CoAP multicast on %s for %d sec",
+                        iface.ip or 'any', now - since)
+            if self._root.igmp_fix_enabled:
+                self._rejoin(iface)
+            iface.next_rejoin = now + iface.rejoin_delay
+            iface.rejoin_delay = min(iface.rejoin_delay * 2, REJOIN_MAX)
+            self.fast_discovery()
+
+    def _rejoin(self, iface):
+        mreq = iface.mreq()
+        try:
+            self._socket.setsockopt(socket.IPPROTO_IP,
+                                    socket.IP_DROP_MEMBERSHIP, mreq)
+        except Exception as ex:
+            LOGGER.debug("Can't drop membership, %s", ex)
+        try:
+            self._socket.setsockopt(socket.IPPROTO_IP,
+                                    socket.IP_ADD_MEMBERSHIP, mreq)
+        except Exception as ex:
+            LOGGER.debug("Can't add membership, %s", ex)
+        iface.joined = time.time()
+        iface.last_received = None
+        iface.rejoin_cnt += 1
+
+    def fast_discovery(self):
+        self._discovery_interval = DISCOVERY_MIN
+        self._next_discovery = 0
+
+    def discovery_due(self):
+        """True when discovery should be sent, interval doubles each time"""
+        now = time.time()
+        if now < self._next_discovery:
+            return False
+        self._next_discovery = now + self._discovery_interval
+        self._discovery_interval = min(self._discovery_interval * 2,
+                                       DISCOVERY_MAX)
+        return True
+
+    def discover(self):
+        for iface in self.interfaces:
+            try:
+                if iface.ip:
+                    self._socket.setsockopt(socket.IPPROTO_IP,
+                                            socket.IP_MULTICAST_IF,
+                                            socket.inet_aton(iface.ip))
+                self._socket.sendto(DISCOVERY_MSG, (COAP_IP, COAP_PORT))
+            except socket.error as ex:
+                LOGGER.debug("Can't send CoAP discovery on %s, %s",
+                             iface.ip or 'any', ex)
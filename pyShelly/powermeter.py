@@ -18,6 +18,8 @@ from .const import (
 
 class PowerMeter(Device):
     """Class to represent a power meter value"""
+    __slots__ = ()
+
     def __init__(self, block, channel, position = None,
                  tot_pos = None, voltage_to_block=False, em=False, topic="emeter", gen=1):
         #Todo: voltage_to_block
@@ -38,7 +40,6 @@ class PowerMeter(Device):
         #     self.meters = meters
         #self.sensor_values = {}
         self.device_type = "POWERMETER"
-        self.info_values = {}
         self.state = None
         meters = "emeters" if em else "meters"
         self._state_cfg = {
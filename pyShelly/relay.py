@@ -28,6 +28,8 @@ from .const import (
 )
 
 class Relay(Device):
+    __slots__ = ()
+
     def __init__(self, block, channel, consumption_channel = None,
                  include_power=True, em=False):
         #Todo: common_consumption
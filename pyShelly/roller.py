@@ -19,6 +19,9 @@ from .const import (
 )
 
 class Roller(Device):
+    __slots__ = ('position', 'support_position', 'motion_state',
+                 'last_direction')
+
     def __init__(self, block):
         super(Roller, self).__init__(block)
         self.id = block.id
@@ -30,7 +33,6 @@ class Roller(Device):
         self.support_position = False
         self.motion_state = ""
         self.last_direction = ""
-        self.info_values = {}
         #success, settings = self.block.http_get("/roller/0") #Todo move
         #if success:
         #    self.support_position = settings.get("positioning", False)
@@ -50,6 +52,9 @@ class Roller(Device):
             self.position = pos
             self.support_position = True
 
+    def coap_positions(self):
+        return self._coap_pos([1102, 112, 122, 113, 1103, 111, 121, 4102])
+
     def update_coap(self, payload):
         """Update current state"""
         self.motion_state = self.coap_get(payload, [1102]) or "stop"
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Status polls of blocks ordered by next due time"""
+
+from datetime import timedelta
+import heapq
+import itertools
+
+#Blocks not polled now are checked again after this
+RECHECK = timedelta(seconds=60)
+
+class Poll_scheduler():
+    """Heap of (due, block id), only the due blocks are looked at
+
+    A block that has pushed CoAP, MQTT or WebSocket since the last poll,
+    block.last_push, is not polled until the interval has passed after
+    the push, but at least every update_status_max_interval. Responses
+    to polls are not pushes.
+    """
+
+    def __init__(self, root):
+        self._root = root
+        self._heap = []
+        self._ids = set()
+        self._seq = itertools.count()
+        self.poll_cnt = 0
+        self.deferred_cnt = 0
+
+    def interval(self, block):
+        """Poll interval of block, per type or the global one"""
+        return self._root.update_status_intervals.get(
+            block.type, self._root.update_status_interval)
+
+    def next_due(self, block, interval):
+        last_poll = block.last_update_status_info
+        if last_poll is None:
+            return None
+        due = last_poll + interval
+        last_push = block.last_push
+        if last_push is not None and last_push + interval > due:
+            due = last_push + interval
+            max_interval = self._root.update_status_max_interval
+            if max_interval is not None:
+                due = min(due, last_poll + max(interval, max_interval))
+        return due
+
+    def add(self, block, due):
+        if block.id not in self._ids:
+            self._ids.add(block.id)
+            self._push(due, block.id)
+
+    def _push(self, due, block_id):
+        heapq.heappush(self._heap, (due, next(self._seq), block_id))
+
+    def run(self, now):
+        """Poll the blocks that are due"""
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, block_id = heapq.heappop(heap)
+            block = self._root.blocks.get(block_id)
+            if block is None:
+                self._ids.discard(block_id)
+                continue
+            interval = self.interval(block)
+            if interval is None or block.sleep_device:
+                self._push(now + RECHECK, block_id)
+                continue
+            due = self.next_due(block, interval)
+            if due is not None and due > now:
+                self.deferred_cnt += 1
+                self._push(due, block_id)
+                continue
+            self.poll_cnt += 1
+            self._root._poll_block(block, True)
+            self._push(now + interval, block_id)
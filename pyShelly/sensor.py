@@ -12,6 +12,8 @@ from .const import (
 )
 
 class Sensor(Device):
+    __slots__ = ('sensor_type', 'sleep_device')
+
     def __init__(self, block, pos, device_type, path, index=None, topic=None, rpc=None):
         super(Sensor, self).__init__(block)
         self.id = block.id
@@ -57,6 +59,8 @@ class Sensor(Device):
 
 class BinarySensor(Sensor):
     """Abstract class to represent binary sensor"""
+    __slots__ = ()
+
     def __init__(self, block, pos, device_type, status_attr, topic=None, rpc=None):
         super(BinarySensor, self).__init__(block, pos, device_type, status_attr, topic=topic, rpc=rpc)
         self.device_type = "BINARY_SENSOR"
@@ -72,18 +76,24 @@ class Motion(BinarySensor):
     #{"motion":true,"timestamp":1614416952,"active":true,"vibration":true,"lux":303,"bat":87}
     #{"G":[[0,6107,1],[0,3119,1614417090],[0,3120,1],[0,6110,0],[0,3106,285],[0,3111,87],[0,9103,11]]}
     """Class to represent a external temp sensor"""
+    __slots__ = ()
+
     def __init__(self, block):
         super(Motion, self).__init__(block, 6107, \
             'motion', 'sensor/motion', topic="@motion")
 
 class ExtSwitch(Sensor):
     """Class to represent a external temp sensor"""
+    __slots__ = ()
+
     def __init__(self, block):
         super(ExtSwitch, self).__init__(block, 3117, \
             'external_switch', 'ext_switch/0/input', topic="/status")
         
 class TempSensor(Sensor):
     """Class to represent a external temp sensor"""
+    __slots__ = ()
+
     def __init__(self, block):
         super(TempSensor, self).__init__(block, [33, 3101], \
             'temperature', 'tmp/tC', topic="sensor/temperature")
@@ -98,6 +108,8 @@ class TempSensor(Sensor):
 
 class ExtTemp(Sensor):
     """Class to represent a external temp sensor"""
+    __slots__ = ()
+
     def __init__(self, block, idx):
         super(ExtTemp, self).__init__(block, [119, 3101], \
             'temperature', 'ext_temperature/' + str(idx) + "/tC", idx, "ext_temperature/$")
@@ -114,6 +126,8 @@ class ExtTemp(Sensor):
 
 class ExtHumidity(Sensor):
     """Class to represent a external humidity sensor"""
+    __slots__ = ()
+
     def __init__(self, block, idx):
         super(ExtHumidity, self).__init__(block, [120, 3103], \
             'humidity', 'ext_humidity/' + str(idx) + "/hum", idx, "ext_humidity/$")
@@ -122,18 +136,24 @@ class ExtHumidity(Sensor):
 
 class Flood(BinarySensor):
     """Class to represent a flood sensor"""
+    __slots__ = ()
+
     def __init__(self, block):
         super(Flood, self).__init__(block, [23, 6106], 'flood', 'flood', topic='sensor/flood')
         self.sleep_device = True
 
 class Smoke(BinarySensor):
     """Class to represent a flood sensor"""
+    __slots__ = ()
+
     def __init__(self, block):
         super(Smoke, self).__init__(block, None, 'smoke', 'smoke', rpc='smoke:0/alarm')  #RPC or topic??
         self.sleep_device = True
 
 class DoorWindow(BinarySensor):
     """Class to represent a door/window sensor"""
+    __slots__ = ()
+
     def __init__(self, block, position):
         super(DoorWindow, self).__init__(
             block, position, 'door_window', 'sensor/state', topic='sensor/state')
@@ -141,6 +161,8 @@ class DoorWindow(BinarySensor):
 
 class Gas(BinarySensor):
     """Class to represent a Gas sensor"""
+    __slots__ = ()
+
     def __init__(self, block, position):
         super(Gas, self).__init__(
             block, position, 'gas', 'gas_sensor/alarm_state')
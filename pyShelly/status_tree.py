@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Merged Gen2 status of a block, updated by full status and deltas"""
+
+#Top level keys of NotifyStatus/NotifyEvent that are not status
+SKIP_KEYS = ('ts', 'events')
+
+def _changed(paths):
+    prefixes = set()
+    for path in paths:
+        for size in range(1, len(path) + 1):
+            prefixes.add(path[:size])
+    return set(paths), prefixes
+
+class Status_tree():
+    """Status of all components, deltas are merged in place
+
+    A delta only holds the values that changed, like a JSON merge patch,
+    null removes the value. A full status also removes values it does
+    not have. Lists are values, not merged.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def update(self, status, full=False):
+        """Merge status, return {top key: (changed paths, prefixes)}"""
+        changed = {}
+        if full:
+            for key in list(self.data):
+                if key not in status:
+                    del self.data[key]
+                    changed[key] = _changed([(key,)])
+        for key, value in status.items():
+            if key in SKIP_KEYS:
+                continue
+            paths = []
+            self._merge(self.data, key, value, (key,), paths, full)
+            if paths:
+                changed[key] = _changed(paths)
+        return changed
+
+    def all_paths(self):
+        """Changed paths that match every value in the tree"""
+        return {key: _changed([(key,)]) for key in self.data}
+
+    def _merge(self, node, key, value, path, paths, full):
+        old = node.get(key)
+        if value is None:
+            if key in node:
+                del node[key]
+                paths.append(path)
+            return
+        if old == value and type(old) is type(value):
+            #Unchanged, components of a poll are compared without a walk
+            return
+        if not isinstance(value, dict):
+            node[key] = value
+            paths.append(path)
+            return
+        if not isinstance(old, dict):
+            #New component, the path covers all values in it
+            old = node[key] = {}
+            paths.append(path)
+            paths = []
+        elif full:
+            for sub_key in list(old):
+                if sub_key not in value:
+                    del old[sub_key]
+                    paths.append(path + (sub_key,))
+        for sub_key, sub_value in value.items():
+            self._merge(old, sub_key, sub_value, path + (sub_key,), paths,
+                        full)
@@ -17,6 +17,10 @@ from .const import (
 
 class Switch(Device):
     """Class to represent a power meter value"""
+    __slots__ = ('_position', '_event_pos', '_event_cnt_pos', '_simulate_state',
+                 'last_event', 'event_cnt', 'hold_delay', 'hold_event_cnt',
+                 'battery', 'timer')
+
     def __init__(self, block, channel, 
                  position=None, simulate_state=False, master_unit=False):
         super(Switch, self).__init__(block)
@@ -72,6 +76,9 @@ class Switch(Device):
         if state != None:
             self.__update(state, None, None, SRC_MQTT)
 
+    def rpc_components(self):
+        return ('input:' + str(self._channel),)
+
     def update_rpc(self, rpc_data, src):
         state = self._get_rpc_value({ATTR_RPC:'input:$/state'}, rpc_data)
         self.__update(state, None, None, SRC_MQTT)
@@ -83,6 +90,14 @@ class Switch(Device):
             event_cnt = data["event_cnt"]
             self.__update(None, event_cnt, event, SRC_MQTT)
 
+    def mqtt_topics(self):
+        return ("input_event/" + str(self._channel),)
+
+    def coap_positions(self):
+        return self._coap_pos(self._position) + \
+            self._coap_pos(self._event_cnt_pos) + self._coap_pos([3112]) + \
+            self._coap_pos(self._event_pos)
+
     def update_coap(self, payload):
         """Get the power"""
         state = self.coap_get(payload, self._position)
@@ -17,6 +17,8 @@ from .const import (
 )
 
 class Trv(Device):
+    __slots__ = ()
+
     def __init__(self, block):
         super(Trv, self).__init__(block)
         self.id = block.id
@@ -60,6 +62,9 @@ class Trv(Device):
         #     }
         # }
 
+    def coap_positions(self):
+        return ()
+
     def update_coap(self, payload):
         #super().update_coap(payload)
         pass
@@ -68,6 +73,9 @@ class Trv(Device):
         #super().update_status_information(status, src)
         pass
 
+    def mqtt_topics(self):
+        return ()
+
     def update_mqtt(self, payload):
         pass
 
@@ -16,6 +16,15 @@ except:
 from .const import (
     LOGGER
 )
+from .http_pool import Http_pool
+from .digest import parse_challenge
+
+#Connections reused by shelly_http_get
+HTTP_POOL = Http_pool()
+
+#Errors when an idle connection has been closed by the device
+_STALE_ERRORS = (httplib.BadStatusLine, httplib.CannotSendRequest,
+                 socket.error)
 
 class timer():
     def __init__(self, interval):
@@ -51,31 +60,42 @@ def exception_log(ex, _msg, *args):
     except Exception as ex:
         LOGGER.error("Exception log error %s", ex)
 
-def shelly_http_get(host, url, username, password, log_error=True):
-    """Send HTTP GET request"""
+def shelly_http_get(host, url, username, password, log_error=True, raw=False):
+    """Send HTTP GET request, raw=True returns the body without parsing"""
     res = ""
     success = False
-    conn = None
     try:
         LOGGER.debug("http://%s%s", host, url)
-        conn = httplib.HTTPConnection(host, timeout=5)
-        headers = {"Connection": "close"}        
-        conn.request("GET", url, None, headers)
-        resp = conn.getresponse()
+        auth = None
+        if username is not None and password is not None:
+            combo = '%s:%s' % (username, password)
+            auth = "Basic %s" % s(base64.b64encode(combo.encode()))
+        headers = {}
+        digest = HTTP_POOL.digests.get(host)
+        if digest and password is not None:
+            digest = HTTP_POOL.digest(host, password)
+            if digest.nonce is not None:
+                headers["Authorization"] = digest.http_header("GET", url)
+        elif auth and host in HTTP_POOL.auth_hosts:
+            headers["Authorization"] = auth
+        resp, body = _http_request(host, url, headers)
 
-        if resp.status == 401 and \
-            username is not None and password is not None:
-                combo = '%s:%s' % (username, password)
-                auth = s(
-                    base64.b64encode(combo.encode()))  # .replace('\n', '')
-                headers["Authorization"] = "Basic %s" % auth
-                conn.request("GET", url, None, headers)
-                resp = conn.getresponse()
+        if resp.status == 401 and password is not None:
+            #Gen2 asks for digest, the nonce is kept until rejected
+            challenge = resp.getheader("WWW-Authenticate") or ""
+            if challenge.lower().startswith("digest"):
+                digest = HTTP_POOL.digest(host, password)
+                digest.set_challenge(parse_challenge(challenge))
+                headers["Authorization"] = digest.http_header("GET", url)
+                resp, body = _http_request(host, url, headers)
+            elif auth and "Authorization" not in headers:
+                HTTP_POOL.auth_hosts.add(host)
+                headers["Authorization"] = auth
+                resp, body = _http_request(host, url, headers)
 
         if resp.status == 200:
-            body = resp.read()
             #LOGGER.debug("Body: %s", body)
-            res = json.loads(s(body))
+            res = body if raw else json.loads(s(body))
             success = True
             LOGGER.debug("http://%s%s - Ok", host, url)
         else:
@@ -86,11 +106,10 @@ def shelly_http_get(host, url, username, password, log_error=True):
         success = False
         if (type(ex) == socket.timeout):
           msg = "Timeout connecting to http://" + host + url
-          try:
-            res = socket.gethostbyaddr(host)[0]
+          name = HTTP_POOL.host_name(host)
+          if name:
+            res = name
             msg += " [" + res + "]"
-          except Exception as ex:
-            pass
           LOGGER.error(msg)
         else:
           res = str(ex)
@@ -98,11 +117,28 @@ def shelly_http_get(host, url, username, password, log_error=True):
               exception_log(ex, "Error http GET: http://{}{}", host, url)
           else:
               LOGGER.debug("Fail http GET: %s %s %s", host, url, ex)
-    finally:
-        if conn:
-            conn.close()
 
     return success, res
 
+def _http_request(host, url, headers):
+    """GET url on a kept connection, return (response, body)"""
+    while True:
+        conn, reused = HTTP_POOL.get(host)
+        try:
+            conn.request("GET", url, None, headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        except Exception as ex:
+            conn.close()
+            if reused and isinstance(ex, _STALE_ERRORS) \
+                    and not isinstance(ex, socket.timeout):
+                continue
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            HTTP_POOL.put(host, conn)
+        return resp, body
+
 def notNone(value, default):
     return default if value is None else value
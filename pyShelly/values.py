@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""Compact storage of info values and state per source
+
+Info value names get an id from a table shared by all instances of a
+class. An instance keeps lists indexed by that id, one for the update
+time and one per source that has sent values, instead of a dict each.
+"""
+
+import threading
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from .const import (
+    SRC_COAP,
+    SRC_STATUS,
+    SRC_MQTT,
+    SRC_MQTT_STATUS,
+    SRC_WS,
+    SRC_WS_STATUS
+)
+
+#Index of the sources with their own values
+SOURCE_SLOTS = {SRC_COAP: 0, SRC_STATUS: 1, SRC_MQTT: 2, SRC_MQTT_STATUS: 3,
+                SRC_WS: 4, SRC_WS_STATUS: 5}
+
+_LOCK = threading.Lock()
+
+class Field_table():
+    """Ids of the info value names used by one class"""
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def get_id(self, name):
+        field_id = self.ids.get(name)
+        if field_id is None:
+            with _LOCK:
+                field_id = self.ids.get(name)
+                if field_id is None:
+                    field_id = len(self.names)
+                    self.names.append(name)
+                    self.ids[name] = field_id
+        return field_id
+
+def field_table(cls):
+    """Return the Field_table of cls, not shared with sub classes"""
+    table = cls.__dict__.get('_field_table')
+    if table is None:
+        with _LOCK:
+            table = cls.__dict__.get('_field_table')
+            if table is None:
+                table = Field_table()
+                setattr(cls, '_field_table', table)
+    return table
+
+def put(values, field_id, value):
+    """Set values[field_id], values is extended with None when short"""
+    if field_id >= len(values):
+        values.extend([None] * (field_id + 1 - len(values)))
+    values[field_id] = value
+
+class Field_view(Mapping):
+    """Read only dict of name -> value for a list indexed by field id"""
+
+    def __init__(self, table, values):
+        self._table = table
+        self._values = values or ()
+
+    def __getitem__(self, name):
+        field_id = self._table.ids.get(name)
+        if field_id is None or field_id >= len(self._values) \
+                or self._values[field_id] is None:
+            raise KeyError(name)
+        return self._values[field_id]
+
+    def __iter__(self):
+        for name, value in zip(self._table.names, self._values):
+            if value is not None:
+                yield name
+
+    def __len__(self):
+        return sum(1 for value in self._values if value is not None)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+class Source_state():
+    """State from one source, kept in the _states list of the instance"""
+
+    def __init__(self, src):
+        self._slot = SOURCE_SLOTS[src]
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        states = obj._states
+        return states[self._slot] if states else None
+
+    def __set__(self, obj, value):
+        if obj._states is None:
+            obj._states = [None] * len(SOURCE_SLOTS)
+        obj._states[self._slot] = value
+
+class Source_values():
+    """Field_view of the values from one source, src None for times"""
+
+    def __init__(self, src):
+        self._slot = SOURCE_SLOTS[src] if src is not None else None
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        if self._slot is None:
+            values = obj._updated
+        else:
+            values = obj._source_values[self._slot] \
+                if obj._source_values else None
+        return Field_view(obj._fields, values)
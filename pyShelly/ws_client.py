@@ -1,16 +1,22 @@
 import socket
 import uuid
+from collections import OrderedDict
 import threading
 import json
 import websocket
 from datetime import datetime
 
 from .utils import error_log
+from .digest import Digest_auth
+from .capture import KIND_WS
 
 from .const import (
     LOGGER, SHELLY_TYPES, SRC_WS, SRC_WS_STATUS
 )
 
+#Requests kept for a retry with auth
+MAX_SENT = 100
+
 class WebSocket:
     def __init__(self, block):
         self.block = block
@@ -21,38 +27,55 @@ class WebSocket:
         self.last_try_connect = None
         self.try_connect = 0
         self.thread = None
+        #Digest auth of the device, set by the first rejected request
+        self.auth = None
+        #Requests waiting for response, id -> (method, params, retried)
+        self._sent = OrderedDict()
         #websocket.enableTrace(True)
         self.check()
     def on_open(self, ws):
         #print("Connected Websocket", self.block.ip_addr)
         self.connected = True
         self.try_connect = 0
+        self._sent.clear()
         self.send("Shelly.GetStatus")
     def on_close(self, ws, close_status_code, close_msg):        
         self.connected = False
         #print("Websocket closed", self.block.ip_addr)
     def on_message(self, ws, message):
+        if self.block.parent.recorder:
+            self.block.parent.recorder.record(KIND_WS, self.block.ip_addr,
+                                              message, self.block.id,
+                                              self.block.type)
+        if self.block.payload_unchanged(SRC_WS, message):
+            return
         json_msg = json.loads(message)
+        sent = self._sent.pop(json_msg.get("id"), None)
         if "error" in json_msg:
             error = json_msg["error"]["message"];
-            json_error = json.loads(error)
-            if "auth_type" in json_error:
-                # auth: {
-                #   "realm": "shellypro4pm-84cca87e48d8",
-                #   "username": "admin",
-                #   "nonce": 1640195650,
-                #   "cnonce": 1640195650468,
-                #   "response": "cee1a9eab83de7b33a065b5bae9c695ae39cd40dcc1396af69108b2ad9c77528",
-                #   "algorithm": "SHA-256"
-                # }
-                error_log("Restrict login is not supported for Plus/Pro device ({}, {}, {}).", 
-                            self.block.id, self.block.type, self.block.ip_addr)
+            if json_msg["error"].get("code") == 401:
+                # error: {"auth_type": "digest", "nonce": 1625038762,
+                #   "nc": 1, "realm": "shellypro4pm-84cca87e48d8",
+                #   "algorithm": "SHA-256"}
+                password = self.block.parent.password
+                if password is None or not sent or sent[2]:
+                    error_log("Login failed for Plus/Pro device ({}, {}, {}).",
+                              self.block.id, self.block.type,
+                              self.block.ip_addr)
+                    return
+                if self.auth is None or self.auth.password != password:
+                    self.auth = Digest_auth(password)
+                self.auth.set_challenge(json.loads(error))
+                self.send(sent[0], sent[1], True)
             else:   
                 error_log("WS error: {0}", error)
         else:
             params = "params" in json_msg
-            self.block.update_rpc(json_msg["params"] if params else json_msg["result"], SRC_WS if params else SRC_WS_STATUS)
-    def send(self, method, params=None):
+            full = json_msg.get("method") == "NotifyFullStatus"
+            if params:
+                self.block.last_push = datetime.now()
+            self.block.update_rpc(json_msg["params"] if params else json_msg["result"], SRC_WS if params else SRC_WS_STATUS, full)
+    def send(self, method, params=None, _retry=False):
         if not self.connected:
             return False
         try:
@@ -62,6 +85,12 @@ class WebSocket:
                 "method" : method,
                 "params" : params
             }
+            if self.auth:
+                data["auth"] = self.auth.rpc_auth()
+            while len(self._sent) >= MAX_SENT:
+                #Oldest request not answered
+                self._sent.popitem(False)
+            self._sent[self.send_id] = (method, params, _retry)
             self.send_id+=1
             self.ws.send(json.dumps(data))
             return True
@@ -79,7 +108,7 @@ class WebSocket:
         #print("Close")
 
     def check(self):
-        if self.connected:
+        if self.connected or not self.block.parent.websocket_enabled:
             return
         if self.block.ip_addr:
             if self.ws:
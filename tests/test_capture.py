@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Record traffic to a capture file and replay it"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyShelly.firmware
+pyShelly.firmware.Firmware_manager.start_loop = lambda self: None
+from pyShelly import pyShelly as PyShelly
+from pyShelly.capture import (Recorder, read_capture, replay,
+                              KIND_MQTT, KIND_WS)
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'capture.s4h')
+        self.root = PyShelly()
+        self.root.websocket_enabled = False
+
+    def tearDown(self):
+        self.root.close()
+        shutil.rmtree(self.dir)
+        logging.disable(logging.NOTSET)
+
+    def test_read_meta(self):
+        recorder = Recorder(self.path)
+        recorder.record(KIND_MQTT, '10.0.0.5', 'on',
+                        'shellies/shelly1-ABC/relay/0', 'Server')
+        recorder.record(KIND_WS, '10.0.0.6', '{}', 'AABBCC', 'ShellyPlus1')
+        recorder.close()
+        records = [record[1:] for record in read_capture(self.path)]
+        self.assertEqual(records, [
+            (KIND_MQTT, '10.0.0.5', ['shellies/shelly1-ABC/relay/0',
+                                     'Server'], b'on'),
+            (KIND_WS, '10.0.0.6', ['AABBCC', 'ShellyPlus1'], b'{}')])
+
+    def test_replay_ws_unknown_block(self):
+        frame = {"src": "shellyplus1-aabbcc", "method": "NotifyStatus",
+                 "params": {"ts": 1, "switch:0": {"id": 0, "output": True}}}
+        recorder = Recorder(self.path)
+        recorder.record(KIND_WS, '10.0.0.6', json.dumps(frame),
+                        'aabbcc', 'ShellyPlus1')
+        recorder.close()
+        counts = replay(self.root, self.path)
+        self.assertEqual(counts[KIND_WS], 1)
+        block = self.root.blocks['AABBCC']
+        self.assertEqual(block.type, 'ShellyPlus1')
+        self.assertEqual(block.ip_addr, '10.0.0.6')
+        relay = [dev for dev in block.devices
+                 if type(dev).__name__ == 'Relay'][0]
+        self.assertTrue(relay.state)
+        self.assertIsNotNone(block.last_push)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""CoAP positions resolved from the device description (/cit/d)"""
+
+import json
+import logging
+import unittest
+
+import pyShelly.firmware
+pyShelly.firmware.Firmware_manager.start_loop = lambda self: None
+from pyShelly import pyShelly as PyShelly
+from pyShelly.const import ATTR_POS, INFO_VALUE_FW_VERSION
+from pyShelly.extractor import compile_cfg
+
+CIT = {"blk": [], "sen": [{"I": 4101, "T": "P"}, {"I": 1101, "T": "S"}]}
+
+class Executor():
+    """Keeps the submitted work instead of running it"""
+
+    def __init__(self):
+        self.work = []
+
+    def submit(self, key, priority, func, *args, **kwargs):
+        self.work.append((func, args))
+        return True
+
+    def close(self):
+        pass
+
+class TestCit(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.saved = {}
+        self.root = PyShelly()
+        self.root.cb_save_cache = self.saved.__setitem__
+        self.root.update_block('A4CF12F3F0D2', 'SHSW-1', '10.0.0.2',
+                               'test', None)
+        self.block = self.root.blocks['A4CF12F3F0D2']
+        self.gets = []
+        self.block.http_get = self._http_get
+
+    def tearDown(self):
+        self.root.close()
+        logging.disable(logging.NOTSET)
+
+    def _http_get(self, url, log_error=True):
+        self.gets.append(url)
+        return True, CIT
+
+    def test_resolve_coap(self):
+        ext = compile_cfg({ATTR_POS: [111, 4101]}, 0)
+        self.assertEqual(ext.resolve_coap({4101, 1101}).coap_pos, (4101,))
+        #Kept when the description has none of the positions
+        self.assertEqual(ext.resolve_coap({1101}).coap_pos, (111, 4101))
+
+    def test_discovery_without_fw(self):
+        self.block.update_cit(json.dumps(CIT))
+        self.assertIsNone(self.block._cit_key)
+        self.assertEqual(self.saved, {})
+        self.block._check_cit()
+        self.assertEqual(self.gets, [])
+
+    def test_fetch_on_executor(self):
+        executor = self.root._poll_executor = Executor()
+        self.block.info_values[INFO_VALUE_FW_VERSION] = '1.11.0'
+        self.block._check_cit()
+        self.assertEqual(self.gets, [])
+        self.assertEqual(len(executor.work), 1)
+        func, args = executor.work[0]
+        func(*args)
+        self.assertEqual(self.gets, ['/cit/d'])
+        self.assertEqual(self.block._cit_key, 'SHSW-1|1.11.0')
+        self.assertEqual(self.saved['cit'], {'SHSW-1|1.11.0': [1101, 4101]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Parse CoIoT datagrams from a receive buffer"""
+
+import unittest
+
+from pyShelly import coap_parser
+from pyShelly.compat import byte_view, s
+
+PAYLOAD = b'{"G":[[0,112,1],[0,111,5.5]]}'
+
+def datagram(code=coap_parser.COAP_CODE_STATUS):
+    device = b'SHSW-1#ABCDEF#2'
+    #Option 3332 as delta 14 (+2 bytes) and length 13 (+1 byte)
+    return bytearray([0x50, code, 0, 1, 0xED, 0x0B, 0xF7,
+                      len(device) - 13]) + device + b'\xff' + PAYLOAD
+
+class TestCoapParser(unittest.TestCase):
+
+    def test_parse(self):
+        msg = coap_parser.parse(byte_view(datagram()), '10.0.0.2')
+        self.assertEqual(msg.code, coap_parser.COAP_CODE_STATUS)
+        self.assertEqual(msg.device_type, 'SHSW-1')
+        self.assertEqual(msg.device_id, 'ABCDEF')
+        self.assertEqual(msg.ipaddr, '10.0.0.2')
+        self.assertEqual(bytes(msg.payload), PAYLOAD)
+        self.assertEqual(coap_parser.decode_status(s(msg.payload)),
+                         {112: 1, 111: 5.5})
+
+    def test_parse_proxy(self):
+        data = byte_view(coap_parser.PROXY_PREFIX + b'\x0a\x00\x00\x07'
+                         + bytes(datagram()))
+        msg = coap_parser.parse(data, '10.0.0.2')
+        self.assertEqual(msg.ipaddr, '10.0.0.7')
+        self.assertEqual(msg.device_id, 'ABCDEF')
+
+    def test_parse_other_code(self):
+        self.assertIsNone(coap_parser.parse(byte_view(datagram(1)), 'x'))
+
+    def test_decode_status_dw2(self):
+        payload = '{"G":[[0,9103,1],,[0,3109,-1][0,6110,0]]}'
+        self.assertEqual(coap_parser.decode_status(payload),
+                         {9103: 1, 3109: -1, 6110: 0})
+
+    def test_split_batch(self):
+        data = coap_parser.BATCH_PREFIX \
+            + coap_parser.pack_frame(bytes(datagram()), '10.0.0.7') \
+            + coap_parser.pack_frame(b'abc', '10.0.0.8')
+        frames = [(bytes(frame), ipaddr) for frame, ipaddr
+                  in coap_parser.split_batch(byte_view(bytearray(data)))]
+        self.assertEqual(frames, [(bytes(datagram()), '10.0.0.7'),
+                                  (b'abc', '10.0.0.8')])
+
+if __name__ == '__main__':
+    unittest.main()
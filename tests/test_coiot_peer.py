@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Gen1 devices set to CoIoT unicast and back to multicast"""
+
+from datetime import datetime, timedelta
+import logging
+import unittest
+
+import pyShelly.firmware
+pyShelly.firmware.Firmware_manager.start_loop = lambda self: None
+from pyShelly import pyShelly as PyShelly
+from pyShelly.const import INFO_VALUE_FW_VERSION
+from pyShelly.coiot_peer import (PEER_PENDING, PEER_UNICAST,
+                                 PEER_MULTICAST, REBOOT_TIME)
+
+PEER = '10.0.0.1:5683'
+
+class Executor():
+    """Runs the submitted work by run()"""
+
+    def __init__(self):
+        self.work = []
+
+    def submit(self, key, func, *args):
+        self.work.append((func, args))
+
+    def run(self):
+        work, self.work = self.work, []
+        for func, args in work:
+            func(*args)
+
+    def close(self):
+        pass
+
+class TestCoiotPeer(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.root = PyShelly()
+        self.root.update_block('A4CF12F3F0D2', 'SHSW-1', '10.0.0.2',
+                               'test', None)
+        self.block = self.root.blocks['A4CF12F3F0D2']
+        self.block.info_values[INFO_VALUE_FW_VERSION] = '1.11.0'
+        self.block.http_get = self._http_get
+        self.peer = ''
+        self.reboot_ok = True
+        self.gets = []
+        self.mgr = self.root._coiot_peer
+        self.mgr.peer = PEER
+        self.mgr._executor = Executor()
+
+    def tearDown(self):
+        self.root.close()
+        logging.disable(logging.NOTSET)
+
+    def _http_get(self, url, log_error=True):
+        self.gets.append(url)
+        if url == '/reboot':
+            return self.reboot_ok, {}
+        if url.startswith('/settings?'):
+            self.peer = url.rpartition('coiot_peer=')[2]
+        return True, {'coiot': {'enabled': True, 'peer': self.peer}}
+
+    def _loop(self):
+        self.mgr.loop_timer()
+        self.mgr._executor.run()
+
+    def _expire(self):
+        self.mgr._since[self.block.id] -= self.mgr.verify_time \
+            + REBOOT_TIME + timedelta(seconds=1)
+
+    def test_reboot_retried(self):
+        self.reboot_ok = False
+        self._loop()
+        self.assertEqual(self.peer, PEER)
+        self.assertEqual(self.mgr.state[self.block.id], PEER_PENDING)
+        self.assertEqual(self.gets.count('/reboot'), 1)
+        self._expire()
+        self._loop()
+        #Not back to multicast while the reboot has not been done
+        self.assertEqual(self.gets.count('/reboot'), 2)
+        self.assertEqual(self.peer, PEER)
+        self.reboot_ok = True
+        self._loop()
+        self.assertEqual(self.gets.count('/reboot'), 3)
+        self.assertNotIn(self.block.id, self.mgr._reboot)
+
+    def test_verified_by_unicast(self):
+        self._loop()
+        self.block.last_coap = datetime.now() + timedelta(minutes=1)
+        self._loop()
+        self.assertEqual(self.mgr.state[self.block.id], PEER_PENDING)
+        self.block.last_coap_unicast = datetime.now() + timedelta(minutes=1)
+        self._loop()
+        self.assertEqual(self.mgr.state[self.block.id], PEER_UNICAST)
+
+    def test_fallback_reboots(self):
+        self._loop()
+        self.block.last_coap = datetime.now() + timedelta(minutes=1)
+        del self.gets[:]
+        self._expire()
+        self._loop()
+        self.assertEqual(self.gets, ['/settings?coiot_peer=', '/reboot'])
+        self.assertEqual(self.mgr.state[self.block.id], PEER_MULTICAST)
+
+if __name__ == '__main__':
+    unittest.main()
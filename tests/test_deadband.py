@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Changes smaller than the deadband are held back"""
+
+import logging
+import unittest
+
+import pyShelly.firmware
+pyShelly.firmware.Firmware_manager.start_loop = lambda self: None
+from pyShelly import pyShelly as PyShelly
+from pyShelly.const import SRC_COAP
+from pyShelly.deadband import Deadband_filter
+from pyShelly.powermeter import PowerMeter
+
+class TestDeadband(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.root = PyShelly()
+        self.updates = []
+
+    def tearDown(self):
+        self.root.close()
+        logging.disable(logging.NOTSET)
+
+    def _powermeter(self, deadbands):
+        if deadbands:
+            self.root._deadband = Deadband_filter(deadbands, None)
+        self.root.update_block('A4CF12F3F0D2', 'SHSW-PM', '10.0.0.2',
+                               'test', None)
+        block = self.root.blocks['A4CF12F3F0D2']
+        meter = [dev for dev in block.devices
+                 if isinstance(dev, PowerMeter)][0]
+        meter.cb_updated.append(lambda dev: self.updates.append(dev.state))
+        return meter
+
+    def _set(self, meter, value):
+        meter._set_state(value, SRC_COAP)
+        meter.raise_updated()
+
+    def test_state_held(self):
+        meter = self._powermeter({'state': 5})
+        self.assertTrue(meter.debug)
+        self._set(meter, 100.0)
+        for step in range(1, 50):
+            self._set(meter, 100.0 + step * 0.01)
+        self.assertEqual(self.updates, [100.0])
+        self._set(meter, 106.0)
+        self.assertEqual(self.updates, [100.0, 106.0])
+        self.assertEqual(self.root._deadband.held_cnt, 49)
+
+    def test_other_deadband(self):
+        meter = self._powermeter({'voltage': 5})
+        self._set(meter, 100.0)
+        self._set(meter, 100.01)
+        self.assertEqual(self.updates, [100.0, 100.01])
+
+if __name__ == '__main__':
+    unittest.main()
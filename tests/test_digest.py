@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Known answers of the Gen2 SHA-256 digest authentication"""
+
+import unittest
+
+from pyShelly.digest import Digest_auth, parse_challenge
+
+class TestDigest(unittest.TestCase):
+
+    def test_http_header_rfc7616(self):
+        """Example of RFC 7616 section 3.9.1, SHA-256"""
+        auth = Digest_auth('Circle of Life', 'Mufasa')
+        auth.set_challenge(parse_challenge(
+            'Digest realm="http-auth@example.org", qop="auth, auth-int", '
+            'algorithm=SHA-256, '
+            'nonce="7ypf/xlj9XXwfDPEoM4URrv/xwf94BcCAzFZH4GiTo0v", '
+            'opaque="FQhe/qaU925kfnzjCev0ciny7QMkPqMAFRtzCUYo5tdS"'))
+        header = parse_challenge(auth.http_header(
+            'GET', '/dir/index.html',
+            'f2/wE4q74E6zIJEtWaHKaf5wv/H5QzzpXusqGemxURZJ'))
+        self.assertEqual(header['nc'], '00000001')
+        self.assertEqual(header['response'], '753927fa0e85d155564e2e272a28d18'
+                         '02ca10daf4496794697cf8db5856cb6c1')
+
+    def test_http_header_nonce_reuse(self):
+        auth = Digest_auth('Circle of Life', 'Mufasa')
+        auth.set_challenge({'realm': 'http-auth@example.org',
+                            'nonce': 'abc'})
+        auth.http_header('GET', '/')
+        header = parse_challenge(auth.http_header('GET', '/'))
+        self.assertEqual(header['nc'], '00000002')
+        auth.set_challenge({'realm': 'http-auth@example.org',
+                            'nonce': 'def'})
+        header = parse_challenge(auth.http_header('GET', '/'))
+        self.assertEqual(header['nc'], '00000001')
+        self.assertEqual(header['nonce'], 'def')
+
+    def test_rpc_auth(self):
+        """RPC auth of the Gen2 documentation, password demopass"""
+        auth = Digest_auth('demopass')
+        auth.set_challenge({'auth_type': 'digest', 'nonce': 1625038762,
+                            'nc': 1, 'realm': 'shellypro4pm-f008d1d8b8b8',
+                            'algorithm': 'SHA-256'})
+        res = auth.rpc_auth(313273957)
+        self.assertEqual(res['username'], 'admin')
+        self.assertEqual(res['nonce'], 1625038762)
+        self.assertEqual(res['cnonce'], 313273957)
+        self.assertEqual(res['response'], '261eae27a1cdd60cb017f58c5d49155d'
+                         '666bfb2a12c1a82ce5341913ccbfed60')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Overflow policies of the event stream"""
+
+import asyncio
+import unittest
+
+from pyShelly.events import (Event, Event_stream, EVENT_UPDATED,
+                             EVENT_DEVICE_ADDED, OVERFLOW_LATEST,
+                             OVERFLOW_DROP_OLDEST)
+
+class Obj():
+
+    def __init__(self, obj_id):
+        self.id = obj_id
+        self.cb_changed = []
+
+class TestEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.objs = [Obj(idx) for idx in range(4)]
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _stream(self, policy):
+        return Event_stream(None, self.loop, 3, policy)
+
+    def _update(self, stream, idx, name):
+        stream.put(Event(EVENT_UPDATED, self.objs[idx], {name: 1}))
+
+    def _queued(self, stream):
+        return [(event.obj.id, sorted(event.changes))
+                for event in stream._queue if event.kind == EVENT_UPDATED]
+
+    def test_latest_merges_same_object(self):
+        stream = self._stream(OVERFLOW_LATEST)
+        for idx in range(3):
+            self._update(stream, idx, 'power')
+        self._update(stream, 1, 'voltage')
+        self.assertEqual(self._queued(stream), [
+            (0, ['power']), (1, ['power', 'voltage']), (2, ['power'])])
+        self.assertEqual((stream.merged_cnt, stream.dropped_cnt), (1, 0))
+
+    def test_latest_merges_superseded(self):
+        stream = self._stream(OVERFLOW_LATEST)
+        self._update(stream, 0, 'power')
+        self._update(stream, 1, 'power')
+        self._update(stream, 0, 'voltage')
+        self._update(stream, 2, 'power')
+        #The only update of 1 is kept
+        self.assertEqual(self._queued(stream), [
+            (1, ['power']), (0, ['power', 'voltage']), (2, ['power'])])
+        self.assertEqual((stream.merged_cnt, stream.dropped_cnt), (1, 0))
+
+    def test_latest_drops_oldest(self):
+        stream = self._stream(OVERFLOW_LATEST)
+        for idx in range(4):
+            self._update(stream, idx, 'power')
+        self.assertEqual([obj_id for obj_id, _ in self._queued(stream)],
+                         [1, 2, 3])
+        self.assertEqual((stream.merged_cnt, stream.dropped_cnt), (0, 1))
+
+    def test_drop_oldest(self):
+        stream = self._stream(OVERFLOW_DROP_OLDEST)
+        self._update(stream, 0, 'power')
+        self._update(stream, 1, 'power')
+        self._update(stream, 0, 'voltage')
+        self._update(stream, 2, 'power')
+        self.assertEqual([obj_id for obj_id, _ in self._queued(stream)],
+                         [1, 0, 2])
+        self.assertEqual(stream.dropped_cnt, 1)
+
+    def test_added_not_bounded(self):
+        stream = self._stream(OVERFLOW_LATEST)
+        for idx in range(3):
+            self._update(stream, idx, 'power')
+        stream.put(Event(EVENT_DEVICE_ADDED, self.objs[3]))
+        self.assertEqual(len(stream._queue), 4)
+        self.assertEqual(stream.dropped_cnt, 0)
+
+if __name__ == '__main__':
+    unittest.main()
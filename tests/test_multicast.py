@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Silence of CoAP multicast on the joined interfaces"""
+
+import logging
+import time
+import unittest
+
+import pyShelly.firmware
+pyShelly.firmware.Firmware_manager.start_loop = lambda self: None
+from pyShelly import pyShelly as PyShelly
+from pyShelly.coiot_peer import PEER_UNICAST
+from pyShelly.multicast import Interface, SILENCE_MIN
+
+class TestMulticast(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.root = PyShelly()
+        self.root.update_block('A4CF12F3F0D2', 'SHSW-1', '10.0.0.2',
+                               'test', None)
+        self.multicast = self.root._coap.multicast
+        iface = Interface('')
+        iface.joined = time.time() - 2 * SILENCE_MIN
+        self.multicast.interfaces.append(iface)
+        #Discovery not due
+        self.multicast._next_discovery = time.time() + 60
+
+    def tearDown(self):
+        self.root.close()
+        logging.disable(logging.NOTSET)
+
+    def test_silence(self):
+        self.multicast.check()
+        self.assertEqual(self.multicast._next_discovery, 0)
+        self.assertGreater(self.multicast.interfaces[0].next_rejoin, 0)
+
+    def test_silence_in_unicast_mode(self):
+        peer = self.root._coiot_peer
+        peer.peer = '10.0.0.1:5683'
+        peer.state['A4CF12F3F0D2'] = PEER_UNICAST
+        self.multicast.check()
+        self.assertGreater(self.multicast._next_discovery, 0)
+        self.assertEqual(self.multicast.interfaces[0].next_rejoin, 0)
+        #A block still on multicast
+        self.root.update_block('A4CF12F3F0D3', 'SHSW-1', '10.0.0.3',
+                               'test', None)
+        self.multicast._next_check = 0
+        self.multicast.check()
+        self.assertEqual(self.multicast._next_discovery, 0)
+
+if __name__ == '__main__':
+    unittest.main()
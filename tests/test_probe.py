@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""Backoff of devices added by IP that don't answer"""
+
+import logging
+import time
+import unittest
+from unittest import mock
+
+import pyShelly.firmware
+pyShelly.firmware.Firmware_manager.start_loop = lambda self: None
+from pyShelly import pyShelly as PyShelly, probe_delay
+
+class TestProbe(unittest.TestCase):
+
+    def test_probe_delay(self):
+        self.assertEqual([probe_delay(errors) for errors in range(8)],
+                         [0, 60, 120, 240, 480, 600, 600, 600])
+        self.assertEqual(probe_delay(1000), 600)
+
+    @mock.patch('pyShelly.shelly_http_get', lambda *args: (False, None))
+    def test_failed_probes(self):
+        logging.disable(logging.CRITICAL)
+        root = PyShelly()
+        root._mdns = None
+        data = {'id': '10.0.0.2', 'src': 'config', 'done': False}
+        for errors in range(1, 7):
+            start = time.time()
+            root._probe(data, '10.0.0.2')
+            self.assertEqual(data['errors'], errors)
+            self.assertAlmostEqual(data['next_try'] - start,
+                                   probe_delay(errors), delta=1)
+        root.close()
+        logging.disable(logging.NOTSET)
+
+if __name__ == '__main__':
+    unittest.main()